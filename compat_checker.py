@@ -21,32 +21,45 @@
 # License along with this library; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
 ##############################################################################
-import sys, argparse, logging, subprocess, json, os, platform, socket
-import difflib, pprint, tempfile, shutil, re, copy
+import sys, argparse, logging, subprocess, json, os, socket
+import tempfile, shutil, re, hashlib, traceback, errno
+from collections import namedtuple
 import qmp
 from logging import DEBUG, INFO, WARN, ERROR, CRITICAL
 
+try:
+    string_types = (str, unicode)
+except NameError: # Python 3
+    string_types = (str,)
+
 MYDIR = os.path.dirname(__file__)
 GDB_EXTRACTOR = os.path.join(MYDIR, 'gdb-extract-qemu-info.py')
+# where run_gdb_extractor() results are cached:
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+                         'gdb-qemu')
 
 logger = logging.getLogger('compat-checker')
 dbg = logger.debug
 
+def no_dbg(*args, **kwargs):
+    """Replacement for dbg() when debugging messages are disabled"""
+    pass
+
 # devices that can make gdb crash if querying instance properties:
 UNSAFE_DEVICES = set(['i440FX-pcihost', 'pc-dimm', 'q35-pcihost'])
 
-class ValidationContext:
-    """Object carrying information about the context where we're validating information
+class ValidationContext(namedtuple('ValidationContext', 'binary1 binary2 machinename')):
+    """Immutable object carrying information about the context where we're validating information
 
     Attributes:
     * binary1: First binary/dump being verified.
     * binary2: Second binary/dump being verified.
     * machinename: Machine type name.
     """
-    def __init__(self, binary1=None, binary2=None, machinename=None):
-        self.binary1 = binary1
-        self.binary2 = binary2
-        self.machinename = machinename
+    __slots__ = ()
+
+    def __new__(cls, binary1=None, binary2=None, machinename=None):
+        return super(ValidationContext, cls).__new__(cls, binary1, binary2, machinename)
 
     def __str__(self):
         if self.binary1 and self.binary2:
@@ -59,15 +72,19 @@ class ValidationContext:
 
     def log(self, loglevel, msg, *args):
         """Log a simple human-readable message (useful for debugging)"""
-        msg = msg % args
+        if not logger.isEnabledFor(loglevel):
+            return
+        if args:
+            msg = msg % args
         logger.log(loglevel, '%s: %s', self, msg)
 
     def single_binary_ctx(self, b):
         """Return context for validations involving only a single binary"""
-        r = copy.copy(self)
-        r.binary1 = b
-        r.binary2 = None
-        return r
+        return ValidationContext(binary1=b, binary2=None, machinename=self.machinename)
+
+    def with_machine(self, machinename):
+        """Return a new context, for validations of a specific machine-type"""
+        return ValidationContext(binary1=self.binary1, binary2=self.binary2, machinename=machinename)
 
     def b1_ctx(self):
         return self.single_binary_ctx(self.binary1)
@@ -83,44 +100,73 @@ class ValidationContext:
         self.log(loglevel, msg, *args)
 
 def apply_compat_props(binary, machinename, d, compat_props):
-    values = {}
     """Apply a list of compat_props to a d[driver][property] dictionary"""
+    values = {}
+    hierarchy = binary.devtype_hierarchy()
     for cp in compat_props:
-        key = (cp['driver'], cp['property'])
-        if values.get(key) == cp['value']:
-            logger.warn("%s:%s: duplicate compat property: %s.%s=%s", binary, machinename, cp['driver'], cp['property'], cp['value'])
-        values[key] = cp['value']
-        # translate each compat property to all the subtypes
         t = cp['driver']
-        qmp_info = binary.get_one_request('qmp-info') or {}
-        hierarchy = qmp_info.get('devtype-hierarchy', {})
-        subtypes = hierarchy.get(t, [{'name':t}])
+        prop = cp['property']
+        value = cp['value']
+        key = (t, prop)
+        if values.get(key) == value:
+            logger.warn("%s:%s: duplicate compat property: %s.%s=%s", binary, machinename, t, prop, value)
+        values[key] = value
+        # translate each compat property to all the subtypes
+        subtypes = hierarchy.get(t)
+        if subtypes is None:
+            subtypes = (t,)
         dbg("subtypes: %r", subtypes)
-        for subtype in  subtypes:
-            d.setdefault(subtype['name'], {})[cp['property']] = cp['value']
+        for name in subtypes:
+            props = d.get(name)
+            if props is None:
+                props = d[name] = {}
+            props[prop] = value
+
+def get_compat_prop(d, driver, prop):
+    """Look up a value in a d[driver][property] dictionary, or None if not set"""
+    props = d.get(driver)
+    if props is not None:
+        return props.get(prop)
 
 def devtype_has_full_prop_info(devtype):
     return ('props' in devtype) and ('instance_props' in devtype) and len(devtype['instance_props']) > 0
 
-def get_devtype_property_info(devtype, propname):
-    if devtype is None:
+def devtype_prop_index(devtype):
+    """Return (props, instance_props) dictionaries indexed by property name
+
+    Only properties with known default values are included.  If a name
+    appears more than once, the first entry wins.
+    """
+    props = {}
+    for prop in devtype.get('props', []):
+        if 'defval' in prop:
+            props.setdefault(prop['name'], prop)
+    instance_props = {}
+    for prop in devtype.get('instance_props', []):
+        if 'value' in prop:
+            instance_props.setdefault(prop['name'], prop)
+    return (props, instance_props)
+
+def get_devtype_property_info(binary, devtype, propname):
+    idx = binary.get_devtype_prop_index(devtype)
+    if idx is None:
         return None
 
+    props, instance_props = idx
+
     r = None
-    for prop in devtype.get('props', []):
-        if prop['name'] == propname and 'defval' in prop:
-            r = dict(name=prop['name'],
-                     type=prop.get('info', {}).get('name'),
-                     defval=prop['defval'])
-            break
+    prop = props.get(propname)
+    if prop is not None:
+        r = dict(name=prop['name'],
+                 type=prop.get('info', {}).get('name'),
+                 defval=prop['defval'])
 
     ir = None
-    for prop in devtype.get('instance_props', []):
-        if prop['name'] == propname and 'value' in prop:
-            ir = dict(name=prop['name'],
-                      type=prop['type'],
-                      defval=prop['value'])
-            break
+    prop = instance_props.get(propname)
+    if prop is not None:
+        ir = dict(name=prop['name'],
+                  type=prop['type'],
+                  defval=prop['value'])
 
     if ir is not None and r is not None:
         assert r['name'] == ir['name']
@@ -136,11 +182,55 @@ def get_devtype_property_info(devtype, propname):
     else:
         return r
 
+# property type names that are parsed as integers:
+INT_TYPE_RE = re.compile(r'u?int(|8|16|32|64)')
+BOOL_TYPES = frozenset(['bool', 'boolean'])
+STR_TYPES = frozenset(['str', 'string'])
+# note that 1 == True and 0 == False, so integers are accepted too:
+BOOL_VALUES = frozenset(['on', 'yes', 'true', 'off', 'no', 'false', True, False])
+TRUE_BOOL_VALUES = frozenset(['on', 'yes', 'true', True])
+
 KNOWN_ENUMS = {
-    'FdcDriveType': ["144", "288", "120", "none", "auto"],
-    'OnOffAuto': ['on', 'off', 'auto']
+    'FdcDriveType': frozenset(["144", "288", "120", "none", "auto"]),
+    'OnOffAuto': frozenset(['on', 'off', 'auto']),
 }
 
+def parse_int_value(t, value):
+    if isinstance(value, string_types):
+        value = int(value, base=0)
+    return value
+
+def parse_bool_value(t, value):
+    assert value in BOOL_VALUES, "Invalid boolean value: %s" % (value)
+    return value in TRUE_BOOL_VALUES
+
+def parse_str_value(t, value):
+    return str(value)
+
+def parse_enum_value(t, value):
+    assert value in KNOWN_ENUMS[t], "Invalid %s value: %s" % (t, value)
+    return value
+
+# property type name -> parse function, filled by property_value_parser():
+PROPERTY_VALUE_PARSERS = {}
+
+def property_value_parser(t):
+    """Return the function that parses values of property type t"""
+    parser = PROPERTY_VALUE_PARSERS.get(t)
+    if parser is None:
+        if t is not None and INT_TYPE_RE.match(t):
+            parser = parse_int_value
+        elif t in BOOL_TYPES:
+            parser = parse_bool_value
+        elif t in STR_TYPES:
+            parser = parse_str_value
+        elif t in KNOWN_ENUMS:
+            parser = parse_enum_value
+        else:
+            raise Exception("Unsupported property type %s" % (t))
+        PROPERTY_VALUE_PARSERS[t] = parser
+    return parser
+
 def parse_property_value(prop, value):
     """Parse a string according to property type
 
@@ -150,51 +240,61 @@ def parse_property_value(prop, value):
         return None
 
     t = prop['type']
-    if t is not None and re.match('u?int(|8|16|32|64)', t):
-        if type(value) in [str, unicode]:
-            value = int(value, base=0)
-        return value
-    elif t == 'bool' or t == 'boolean':
-        assert value in ['on', 'yes', 'true', 'off', 'no', 'false', True, False], "Invalid boolean value: %s" % (value)
-        return value in ['on', 'yes', 'true', True]
-    elif t == 'str' or t == 'string':
-        return str(value)
-    elif t in KNOWN_ENUMS:
-        assert value in KNOWN_ENUMS[t]
-        return value
-    else:
-        raise Exception("Unsupported property type %s" % (t))
+    return property_value_parser(t)(t, value)
+
+# values accepted by try_bool().  Note that 0 == False and 1 == True,
+# so the integers are matched too:
+FALSE_VALUES = frozenset([False, '0', 'off'])
+TRUE_VALUES = frozenset([True, '1', 'on'])
 
 def try_bool(v):
     """Try to convert a value to a boolean, keep it untouched otherwise"""
-    if v in [0, False, '0', 'off']:
-        return False
-    elif v in [1, True, '1', 'on']:
-        return True
-    else:
-        return v
+    try:
+        if v in FALSE_VALUES:
+            return False
+        elif v in TRUE_VALUES:
+            return True
+    except TypeError:
+        # unhashable values (e.g. lists) can't be booleans
+        pass
+    return v
 
 def bool_to_str(v):
     """Convert boolean values to str, keep anything else untouched"""
-    if v == False:
+    if v is False:
         return 'off'
-    elif v == True:
+    elif v is True:
         return 'on'
     else:
         return v
 
+def onoffauto_value(v):
+    """Convert bool-like values to OnOffAuto strings"""
+    return bool_to_str(try_bool(v))
+
+# Conversions applied to the value from the other binary, when one binary
+# reports a property with one of these types.
+# We need a special hack for OnOffAuto, because:
+# 1) intel-hda.msi had changed its type from uint32_to OnOffAuto
+# 2) virtio-pci.disable-legacy also changed from bool to OnOffAuto
+PROPERTY_TYPE_COERCIONS = {
+    'OnOffAuto': onoffauto_value,
+}
+
 def compare_properties(p1, v1, p2, v2):
     """Compare two property values, with some hacks to handle type mismatches"""
 
-    # we need a special hack for OnOffAuto, because:
-    # 1) intel-hda.msi had changed its type from uint32_to OnOffAuto
-    # 2) virtio-pci.disable-legacy also changed from bool to OnOffAuto
-    if p1 is not None \
-       and p1.get('type') == 'OnOffAuto':
-       v2 = bool_to_str(try_bool(v2))
-    if p2 is not None \
-       and p2.get('type') == 'OnOffAuto':
-       v1 = bool_to_str(try_bool(v1))
+    # fast path: values of the same type that are already equal don't
+    # need any of the type conversion hacks below:
+    if v1 is v2 or (type(v1) is type(v2) and v1 == v2):
+        return True
+
+    coerce1 = p1 is not None and PROPERTY_TYPE_COERCIONS.get(p1.get('type'))
+    coerce2 = p2 is not None and PROPERTY_TYPE_COERCIONS.get(p2.get('type'))
+    if coerce1:
+        v2 = coerce1(v2)
+    if coerce2:
+        v1 = coerce2(v1)
 
 
     dbg("comparing %r:%r and %r:%r", v1, p1, v2, p2)
@@ -219,29 +319,74 @@ def compare_properties(p1, v1, p2, v2):
 
     return v2 == v1
 
-def get_devtype_property_default_value(devtype, propname):
+def get_devtype_property_default_value(binary, devtype, propname):
     """Extract default value for a property, based on device-type dictionary"""
-    if devtype is None:
+    idx = binary.get_devtype_prop_index(devtype)
+    if idx is None:
         return None
 
+    props, instance_props = idx
+
     r = None
-    for prop in devtype.get('props', []):
-        if prop['name'] == propname and 'defval' in prop:
-            r = prop['defval']
+    prop = props.get(propname)
+    if prop is not None:
+        r = prop['defval']
 
-    for prop in devtype.get('instance_props', []):
-        if prop['name'] == propname and 'value' in prop:
-            if r is not None:
-                assert r == prop['value']
-            return prop['value']
+    prop = instance_props.get(propname)
+    if prop is not None:
+        if r is not None:
+            assert r == prop['value']
+        return prop['value']
 
     return r
 
+# marker for cached values that were not computed yet:
+NOT_COMPUTED = object()
+
+def devtype_hierarchy_from_parents(alltypes):
+    """Build the devtype-hierarchy dictionary from a qom-list-types result
+
+    The result is equivalent to running 'qom-list-types implements=T' for
+    each type T, but it requires the 'parent' and 'abstract' fields that
+    are returned by QEMU 2.10 and newer.
+    """
+    types = dict((d['name'], d) for d in alltypes)
+    implements = dict((d['name'], []) for d in alltypes)
+    for d in alltypes:
+        if d.get('abstract'):
+            continue
+        t = d['name']
+        while t in types:
+            implements[t].append(d)
+            t = types[t].get('parent')
+    return implements
+
+def find_program(path):
+    """Look up a program name in $PATH, like the shell would
+
+    Paths containing a directory separator are returned unchanged.
+    """
+    if os.sep in path:
+        return path
+    for d in os.environ.get('PATH', os.defpath).split(os.pathsep):
+        f = os.path.join(d or os.curdir, path)
+        if os.path.isfile(f) and os.access(f, os.X_OK):
+            return f
+    return path
+
+QEMU_VERSION_RE = re.compile(r'QEMU emulator version ([0-9.]+)', re.M)
+
 AUTO = 0
 BINARY = 1
 JSON = 2
 
-class QEMUBinaryInfo:
+class QEMUBinaryInfo(object):
+    __slots__ = ('path', 'type', '_process', '_tmpdir', '_qmp', 'keep_tmpdata',
+                 'raw_data', '_request_index', '_requests_by_type',
+                 '_devtype_hierarchy', '_qemu_version',
+                 '_qemu_version_numbers', '_omitted_props', '_all_devtypes',
+                 '_available_machines', '_devtype_prop_index')
+
     def __init__(self, path, filetype=AUTO):
         self.path = path
         self.type = filetype
@@ -249,8 +394,78 @@ class QEMUBinaryInfo:
         self._tmpdir = None
         self._qmp = None
         self.keep_tmpdata = False
+        self.raw_data = None
+        self._request_index = None
+        self._requests_by_type = None
+        self._devtype_hierarchy = None
+        self._qemu_version = NOT_COMPUTED
+        self._qemu_version_numbers = NOT_COMPUTED
+        self._omitted_props = None
+        self._all_devtypes = None
+        self._available_machines = None
+        self._devtype_prop_index = None
+
+    def gdb_cache_file(self, machines, devices):
+        """Cache file name for run_gdb_extractor() results
+
+        The name depends on the binary and extractor script paths, sizes and
+        modification times, and on the list of machines and devices queried.
+        Returns None if the binary can't be found, so nothing is cached.
+        Installing or updating debuginfo doesn't change the name, so
+        --no-cache is needed to refresh results after that.
+        """
+        def file_id(path):
+            st = os.stat(path)
+            return (os.path.abspath(path), st.st_mtime, st.st_size)
+        try:
+            key = repr((file_id(find_program(self.path)), file_id(GDB_EXTRACTOR),
+                        list(machines), list(devices)))
+        except OSError:
+            return None
+        if not isinstance(key, bytes):
+            key = key.encode('utf-8')
+        return os.path.join(CACHE_DIR, hashlib.sha1(key).hexdigest() + '.json')
+
+    def load_gdb_cache(self, cache_file):
+        """Load cached run_gdb_extractor() results, or None if not available"""
+        try:
+            with open(cache_file) as f:
+                r = json.load(f)
+        except (IOError, ValueError):
+            return None
+        logger.info("Using cached gdb data from %s", cache_file)
+        return r
+
+    def save_gdb_cache(self, cache_file, r):
+        try:
+            try:
+                os.makedirs(CACHE_DIR)
+            except OSError as e:
+                # another thread may have created it in the meantime
+                if e.errno != errno.EEXIST:
+                    raise
+            # write to a temporary file first, so we never leave a
+            # partially written cache file behind:
+            fd, tmpname = tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(r, f)
+                os.rename(tmpname, cache_file)
+            except:
+                os.unlink(tmpname)
+                raise
+        except (IOError, OSError) as e:
+            logger.warn("Couldn't save gdb data cache: %s", e)
 
     def run_gdb_extractor(self, args, machines, devices=[]):
+        cache_file = None
+        if args.use_cache:
+            cache_file = self.gdb_cache_file(machines, devices)
+        if cache_file is not None:
+            r = self.load_gdb_cache(cache_file)
+            if r is not None:
+                return r
+
         outfile = os.path.join(self.tmpdir(), 'gdb-extractor.json')
         cmd = ['gdb', '-q', '-P', GDB_EXTRACTOR]
         cmd.extend(['-o', outfile])
@@ -263,9 +478,10 @@ class QEMUBinaryInfo:
         if args.loglevel <= DEBUG:
             cmd.append('-d')
         cmd.append(self.path)
-        subprocess.call(cmd)
+        returncode = subprocess.call(cmd)
         try:
-            r = json.load(open(outfile))
+            with open(outfile) as f:
+                r = json.load(f)
         except KeyboardInterrupt:
             raise
         except:
@@ -273,17 +489,40 @@ class QEMUBinaryInfo:
             logger.error("tmp data kept at: %s", outfile)
             self.keep_tmpdata = True
             raise
+        # don't cache results of failed or partial extractions (e.g. when
+        # debuginfo is missing), so they are retried on the next run:
+        if cache_file is not None and returncode == 0 and \
+           not any('exception' in i or 'traceback' in i for i in r):
+            self.save_gdb_cache(cache_file, r)
         return r
 
-    def get_stdout(self, *args):
-        """Helper to simply run QEMU and get stdout output"""
+    def start_process(self, cmd):
+        """Start a command in the background, capturing stdout and stderr
+
+        Returns None if the command couldn't be started.  Use read_stdout()
+        to get the output of the process.
+        """
+        try:
+            return subprocess.Popen(cmd,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT)
+        except KeyboardInterrupt:
+            raise
+        except:
+            return None
+
+    def start_qemu(self, *args):
+        """Start QEMU in the background, see start_process()"""
+        return self.start_process([self.path] + list(args))
+
+    def read_stdout(self, proc):
+        """Wait for a process started by start_process() and return its output"""
+        if proc is None:
+            return None
         try:
             # ignore non-utf8 data to avoid crashing because of
             # https://bugzilla.redhat.com/show_bug.cgi?id=1532195
-            return subprocess.Popen([self.path] + list(args),
-                                    stdout=subprocess.PIPE,
-                                    stderr=subprocess.STDOUT)\
-                   .communicate()[0]\
+            return proc.communicate()[0]\
                    .decode('utf-8','ignore')\
                    .encode("utf-8")
         except KeyboardInterrupt:
@@ -291,12 +530,28 @@ class QEMUBinaryInfo:
         except:
             return None
 
+    def kill_process(self, proc):
+        """Kill a process started by start_process() and wait for it"""
+        if proc is None:
+            return
+        if proc.poll() is None:
+            try:
+                proc.kill()
+            except OSError:
+                # the process exited in the meantime
+                pass
+        proc.communicate()
+
+    def get_stdout(self, *args):
+        """Helper to simply run QEMU and get stdout output"""
+        return self.read_stdout(self.start_qemu(*args))
+
+    def start_rpm_query(self):
+        # if RPM is not available, start_process() will simply return None
+        return self.start_process(['rpm', '-qf', self.path])
+
     def get_rpm_package(self):
-        # use shell to ensure we will just get an error message if RPM
-        # is not available
-        return subprocess.Popen(['sh', '-c', "rpm -qf %s" % (self.path)],
-                                stdout=subprocess.PIPE,
-                                stderr=subprocess.STDOUT).communicate()[0]
+        return self.read_stdout(self.start_rpm_query())
 
     def tmpdir(self):
         if not self._tmpdir:
@@ -331,9 +586,12 @@ class QEMUBinaryInfo:
     def __del__(self):
         self.terminate()
 
-    def query_full_devtype_hierarchy(self):
+    def query_full_devtype_hierarchy(self, alltypes):
+        """Build the devtype hierarchy for the qom-list-types result in alltypes"""
         qmp = self.get_qmp()
-        alltypes =qmp.command('qom-list-types', implements='device', abstract=True)
+        if alltypes and all('parent' in d for d in alltypes):
+            # no need to send one qom-list-types command for each type
+            return devtype_hierarchy_from_parents(alltypes)
         implements = {}
         for d in alltypes:
             implements[d['name']] = qmp.command('qom-list-types', implements=d['name'])
@@ -344,32 +602,56 @@ class QEMUBinaryInfo:
         machines = qmp.command('query-machines')
         devices = qmp.command('qom-list-types', implements='device', abstract=True)
         cpu_models = qmp.command('query-cpu-definitions')
-        devtype_hierarchy = self.query_full_devtype_hierarchy()
+        devtype_hierarchy = self.query_full_devtype_hierarchy(devices)
         return {'machines':machines, 'devices':devices, 'cpu-models':cpu_models,
                 'devtype-hierarchy':devtype_hierarchy }
 
     def append_raw_item(self, reqtype, result, args=[]):
         self.raw_data.append(dict(request=[reqtype] + list(args), result=result))
+        self._request_index = None
 
     def all_devtypes(self):
-        return [d['name'] for d in self.get_one_request('qmp-info')['devices']]
+        """Frozenset of all device type names, cached until raw_data changes"""
+        self.index_requests()
+        if self._all_devtypes is None:
+            self._all_devtypes = frozenset(d['name'] for d in self.get_one_request('qmp-info')['devices'])
+        return self._all_devtypes
 
     def extract_binary_data(self, args):
+        # platform is only needed when extracting data from a binary
+        import platform
+
         self.raw_data = []
-        version_info = {'help': self.get_stdout('-version'),
-                        'rpm-qf': self.get_rpm_package() }
+        # the processes below don't depend on each other, so start all
+        # of them before waiting for any output.  The QMP queries run
+        # while they are still running:
+        version_proc = self.start_qemu('-version')
+        rpm_proc = self.start_rpm_query()
+        help_procs = [(reqtype, self.start_qemu(*qemu_args)) for reqtype, qemu_args in
+                      [('help', ['-help']),
+                       ('device-help', ['-device', 'help']),
+                       ('machine-help', ['-machine', 'help']),
+                       ('cpu-help', ['-cpu', 'help'])]]
         try:
-            version_info['os-release'] = open('/etc/os-release').read()
+            qmp_info = self.query_qmp_info()
+        except:
+            # don't leave the processes started above behind:
+            for proc in [version_proc, rpm_proc] + [p for _, p in help_procs]:
+                self.kill_process(proc)
+            raise
+
+        version_info = {'help': self.read_stdout(version_proc),
+                        'rpm-qf': self.read_stdout(rpm_proc) }
+        try:
+            with open('/etc/os-release') as f:
+                version_info['os-release'] = f.read()
         except IOError:
             pass
         self.append_raw_item('version', version_info)
-        self.append_raw_item('help', self.get_stdout('-help'))
-        self.append_raw_item('device-help', self.get_stdout('-device', 'help'))
-        self.append_raw_item('machine-help', self.get_stdout('-machine', 'help'))
-        self.append_raw_item('cpu-help', self.get_stdout('-cpu', 'help'))
+        for reqtype, proc in help_procs:
+            self.append_raw_item(reqtype, self.read_stdout(proc))
         self.append_raw_item('hostname', {'platform.node': platform.node(),
                                           'gethostname': socket.gethostname()})
-        qmp_info = self.query_qmp_info()
         self.append_raw_item('qmp-info', qmp_info)
         if not args.machines:
             machines = sorted([m['name'] for m in qmp_info['machines']])
@@ -380,11 +662,14 @@ class QEMUBinaryInfo:
         else:
             devices = sorted(self.all_devtypes())
         self.raw_data.extend(self.run_gdb_extractor(args, machines, devices))
+        self._request_index = None
 
     def load_data_file(self, json_data=None):
         if json_data is None:
-            json_data = json.load(open(self.path))
+            with open(self.path) as f:
+                json_data = json.load(f)
         self.raw_data = json_data
+        self._request_index = None
 
     def load_data(self, args):
         if self.type == BINARY:
@@ -405,15 +690,42 @@ class QEMUBinaryInfo:
                 self.extract_binary_data(args)
                 self.type = BINARY
 
-    def list_requests(self, reqtype):
+    def index_requests(self):
+        """Build request lookup tables from raw_data, if not built yet"""
+        if self._request_index is not None:
+            return
+        self._request_index = {}
+        self._requests_by_type = {}
         for i in self.raw_data:
-            if i['request'][0] == reqtype:
-                yield i
+            req = i['request']
+            self._request_index.setdefault(tuple(req), i)
+            self._requests_by_type.setdefault(req[0], []).append(i)
+
+        qmp_info = self.get_one_request('qmp-info') or {}
+        hierarchy = qmp_info.get('devtype-hierarchy', {})
+        self._devtype_hierarchy = dict((t, tuple(st['name'] for st in subtypes))
+                                       for t, subtypes in hierarchy.items())
+        self._qemu_version = NOT_COMPUTED
+        self._qemu_version_numbers = NOT_COMPUTED
+        self._omitted_props = None
+        self._all_devtypes = None
+        self._available_machines = None
+        self._devtype_prop_index = {}
+
+    def devtype_hierarchy(self):
+        """Return {devtype: (subtype names...)} dictionary based on qmp-info"""
+        self.index_requests()
+        return self._devtype_hierarchy
+
+    def list_requests(self, reqtype):
+        self.index_requests()
+        return iter(self._requests_by_type.get(reqtype, []))
 
     def get_one_request(self, reqtype, *args):
-        for m in self.list_requests(reqtype):
-            if m['request'][1:] == list(args):
-                return m.get('result')
+        self.index_requests()
+        m = self._request_index.get((reqtype,) + args)
+        if m is not None:
+            return m.get('result')
 
     def get_machine(self, machinename):
         return self.get_one_request('machine', machinename)
@@ -421,16 +733,62 @@ class QEMUBinaryInfo:
     def get_devtype(self, devtype):
         return self.get_one_request('device-type', devtype)
 
+    def get_devtype_prop_index(self, devtype):
+        """Cached devtype_prop_index() result for a device type, or None
+
+        raw_data itself is not modified, so -O dumps keep the original format.
+        """
+        self.index_requests()
+        idx = self._devtype_prop_index.get(devtype, NOT_COMPUTED)
+        if idx is NOT_COMPUTED:
+            dt = self.get_devtype(devtype)
+            if dt is not None:
+                idx = devtype_prop_index(dt)
+            else:
+                idx = None
+            self._devtype_prop_index[devtype] = idx
+        return idx
+
     def available_machines(self):
-        for m in self.list_requests('machine'):
-            yield m['request'][1]
+        """Frozenset of machine-type names, cached until raw_data changes"""
+        self.index_requests()
+        if self._available_machines is None:
+            self._available_machines = frozenset(m['request'][1] for m in self.list_requests('machine'))
+        return self._available_machines
 
     def qemu_version(self):
+        """QEMU version string, or None if unknown
+
+        The result is computed only once, and cached until raw_data changes.
+        """
+        self.index_requests()
+        if self._qemu_version is NOT_COMPUTED:
+            self._qemu_version = self.parse_qemu_version()
+        return self._qemu_version
+
+    def qemu_version_numbers(self):
+        """QEMU version as a tuple of ints (e.g. (2, 3, 0)), or None if unknown"""
+        self.index_requests()
+        if self._qemu_version_numbers is NOT_COMPUTED:
+            ver = self.qemu_version()
+            if ver is not None:
+                ver = tuple(int(n) for n in ver.split('.'))
+            self._qemu_version_numbers = ver
+        return self._qemu_version_numbers
+
+    def omitted_props(self):
+        """Cached result of build_omitted_prop_dict() for this binary"""
+        self.index_requests()
+        if self._omitted_props is None:
+            self._omitted_props = build_omitted_prop_dict(self)
+        return self._omitted_props
+
+    def parse_qemu_version(self):
         v = self.get_one_request('version')
         if v is None:
             return None
         vhelp = v['help']
-        m = re.search(r'QEMU emulator version ([0-9.]+)', vhelp, re.M)
+        m = QEMU_VERSION_RE.search(vhelp)
         if m is None:
             return None
         return m.group(1)
@@ -438,6 +796,265 @@ class QEMUBinaryInfo:
     def __str__(self):
         return self.path
 
+# Assumed values for properties that don't exist in a given binary.
+# Entries are applied in order, so entries for a subtype can override
+# the value set for its parent type:
+OMITTED_PROP_VALUES = (
+    ('pci-device',           'x-pcie-extcap-init',            False),
+    ('pci-device',           'x-pcie-lnksta-dllla',           False),
+    ('x86_64-cpu',           'kvm-no-smi-migration',           True),
+    ('i386-cpu',             'kvm-no-smi-migration',           True),
+    ('x86_64-cpu',           'full-cpuid-auto-level',         False),
+    ('i386-cpu',             'full-cpuid-auto-level',         False),
+    # tcg-cpuid implemented by commit 1ce36bfe6424243082d3d7c2330e1a0a4ff72a43:
+    ('x86_64-cpu',           'tcg-cpuid',         False),
+    ('i386-cpu',             'tcg-cpuid',         False),
+    ('x86_64-cpu',           'cpuid-0xb',                     False),
+    ('i386-cpu',             'cpuid-0xb',                     False),
+    ('x86_64-cpu',           'l3-cache',                      False),
+    ('i386-cpu',             'l3-cache',                      False),
+    ('x86_64-cpu',           'fill-mtrr-mask',                False),
+    ('i386-cpu',             'fill-mtrr-mask',                False),
+    # commit 6c69dfb67e84747cf071958594d939e845dfcc0c:
+    ('x86_64-cpu',           'x-hv-max-vps', 0x40),
+    ('i386-cpu',             'x-hv-max-vps', 0x40),
+    # commit 9954a1582e18b03ddb66f6c892dccf2c3508f4b2:
+    ('x86_64-cpu',           'vmware-cpuid-freq',             False),
+    ('i386-cpu',             'vmware-cpuid-freq',             False),
+    # commit e265e3e48049fbece9eaf536aa00ca41aa3c54d0:
+    ('x86_64-cpu',           'host-cache-info',                True),
+    ('i386-cpu',             'host-cache-info',                True),
+    # CPU feature flags that were always off when we introduced them:
+    ('x86_64-cpu',           'arat',                          False),
+    ('i386-cpu',             'arat',                          False),
+    ('x86_64-cpu',           'rdrand',                        False),
+    ('i386-cpu',             'rdrand',                        False),
+    ('x86_64-cpu',           'f16c',                          False),
+    ('i386-cpu',             'f16c',                          False),
+
+    # * VMX was disabled on all CPU models when we added CPU
+    #   feature properties (commit 38e5c119c2925812bd441450ab9e5e00fc79e662
+    #   v2.4.0-rc0~101^2~1).
+    # * However, it was enabled on core2duo and coreduo between
+    #   commit 8560efed6a72a816c0115f41ddb9d79f7ce63f28 (v0.13.0-rc0~1093)
+    #   and commit e93abc147fa628650bdbe7fd57f27462ca40a3c2 (v2.2.0-rc0~5^2~1).
+    # * Probably it is possible to work around this by looking at
+    #   the "feature-words" property
+    #('x86_64-cpu',           'vmx',                           ???),
+    #('i386-cpu',             'vmx',                           ???),
+
+    # * VME was already enabled on all CPU models when we added CPU
+    #   feature properties (commit 38e5c119c2925812bd441450ab9e5e00fc79e662
+    #   v2.4.0-rc0~101^2~1).
+    # * However, VME was always disabled on TCG mode and this wasn't
+    #   reported throught the QOM properties until
+    #   commit 04d99c3c61f4bdc0450dbeb6512b6dd743baca65 (v2.8.0-rc0~74^2~18)
+    # * To make it worse, VME was disabled on all CPU models until
+    #   commit b3a4f0b1a072a467d003755ca0e55c5be38387cb (v2.3.0-rc0~137^2~13),
+    # * Probably it is possible to work around this by looking at
+    #   the "feature-words" property
+    #('x86_64-cpu',           'vme',                          ???),
+    #('i386-cpu',             'vme',                          ???),
+
+    # * ABM was already enabled on qemu64, phenom, kvm64, Opteron_G3,
+    #   Opteron_G4, and Opteron_G5 when we added CPU feature properties
+    #   (commit 38e5c119c2925812bd441450ab9e5e00fc79e662 v2.4.0-rc0~101^2~1)
+    # * Note that we have removed ABM from qemu64 on
+    #   commit 711956722c6764336f8b78a2106e57c55f02f36d (v2.5.0-rc0~28^2~2),
+    #   but this should be handled properly because CPU featur properties
+    #   were already available in QEMU 2.4.0
+    #
+    # the default:
+    ('x86_64-cpu',            'abm',                        False),
+    ('i386-cpu',              'abm',                        False),
+    # these below override the default above:
+    ('qemu64-x86_64-cpu',     'abm',                         True),
+    ('qemu64-i386-cpu',       'abm',                         True),
+    ('phenom-x86_64-cpu',     'abm',                         True),
+    ('phenom-i386-cpu',       'abm',                         True),
+    ('kvm64-x86_64-cpu',      'abm',                         True),
+    ('kvm64-i386-cpu',        'abm',                         True),
+    ('Opteron_G3-x86_64-cpu', 'abm',                         True),
+    ('Opteron_G3-i386-cpu',   'abm',                         True),
+    ('Opteron_G4-x86_64-cpu', 'abm',                         True),
+    ('Opteron_G4-i386-cpu',   'abm',                         True),
+    ('Opteron_G5-x86_64-cpu', 'abm',                         True),
+    ('Opteron_G5-i386-cpu',   'abm',                         True),
+
+    # * SSE4A was already enabled on qemu64, phenom, kvm64, Opteron_G3,
+    #   Opteron_G4, and Opteron_G5 when we added CPU feature properties
+    #   (commit 38e5c119c2925812bd441450ab9e5e00fc79e662 v2.4.0-rc0~101^2~1)
+    # the default:
+    ('x86_64-cpu',            'sse4a',                      False),
+    ('i386-cpu',              'sse4a',                      False),
+    # these below override the default above:
+    ('qemu64-x86_64-cpu',     'sse4a',                       True),
+    ('qemu64-i386-cpu',       'sse4a',                       True),
+    ('phenom-x86_64-cpu',     'sse4a',                       True),
+    ('phenom-i386-cpu',       'sse4a',                       True),
+    ('kvm64-x86_64-cpu',      'sse4a',                       True),
+    ('kvm64-i386-cpu',        'sse4a',                       True),
+    ('Opteron_G3-x86_64-cpu', 'sse4a',                       True),
+    ('Opteron_G3-i386-cpu',   'sse4a',                       True),
+    ('Opteron_G4-x86_64-cpu', 'sse4a',                       True),
+    ('Opteron_G4-i386-cpu',   'sse4a',                       True),
+    ('Opteron_G5-x86_64-cpu', 'sse4a',                       True),
+    ('Opteron_G5-i386-cpu',   'sse4a',                       True),
+
+    # * POPCNT was already enabled on many CPU models when we added CPU feature
+    #   properties (commit 38e5c119c2925812bd441450ab9e5e00fc79e662
+    #   v2.4.0-rc0~101^2~1)
+    #
+    # the default:
+    ('x86_64-cpu',                 'popcnt',                False),
+    ('i386-cpu',                   'popcnt',                False),
+    # these below override the default above:
+    ("qemu64-x86_64-cpu",          "popcnt",                 True),
+    ("qemu64-i386-cpu",            "popcnt",                 True),
+    ("phenom-x86_64-cpu",          "popcnt",                 True),
+    ("phenom-i386-cpu",            "popcnt",                 True),
+    ("qemu32-x86_64-cpu",          "popcnt",                 True),
+    ("qemu32-i386-cpu",            "popcnt",                 True),
+    ("Nehalem-x86_64-cpu",         "popcnt",                 True),
+    ("Nehalem-i386-cpu",           "popcnt",                 True),
+    ("Westmere-x86_64-cpu",        "popcnt",                 True),
+    ("Westmere-i386-cpu",          "popcnt",                 True),
+    ("SandyBridge-x86_64-cpu",     "popcnt",                 True),
+    ("SandyBridge-i386-cpu",       "popcnt",                 True),
+    ("IvyBridge-x86_64-cpu",       "popcnt",                 True),
+    ("IvyBridge-i386-cpu",         "popcnt",                 True),
+    ("Haswell-noTSX-x86_64-cpu",   "popcnt",                 True),
+    ("Haswell-noTSX-i386-cpu",     "popcnt",                 True),
+    ("Haswell-x86_64-cpu",         "popcnt",                 True),
+    ("Haswell-i386-cpu",           "popcnt",                 True),
+    ("Broadwell-noTSX-x86_64-cpu", "popcnt",                 True),
+    ("Broadwell-noTSX-i386-cpu",   "popcnt",                 True),
+    ("Broadwell-x86_64-cpu",       "popcnt",                 True),
+    ("Broadwell-i386-cpu",         "popcnt",                 True),
+    ("Opteron_G3-x86_64-cpu",      "popcnt",                 True),
+    ("Opteron_G3-i386-cpu",        "popcnt",                 True),
+    ("Opteron_G4-x86_64-cpu",      "popcnt",                 True),
+    ("Opteron_G4-i386-cpu",        "popcnt",                 True),
+    ("Opteron_G5-x86_64-cpu",      "popcnt",                 True),
+    ("Opteron_G5-i386-cpu",        "popcnt",                 True),
+
+
+    # * RDTSCP was already enabled on many CPU models when we added CPU feature
+    #   properties (commit 38e5c119c2925812bd441450ab9e5e00fc79e662
+    #   v2.4.0-rc0~101^2~1)
+    #
+    # the default:
+    ('x86_64-cpu',                 'rdtscp',              False),
+    ('i386-cpu',                   'rdtscp',              False),
+    # these below override the default above:
+    ("phenom-x86_64-cpu",          "rdtscp",               True),
+    ("SandyBridge-x86_64-cpu",     "rdtscp",               True),
+    ("IvyBridge-x86_64-cpu",       "rdtscp",               True),
+    ("Haswell-noTSX-x86_64-cpu",   "rdtscp",               True),
+    ("Haswell-x86_64-cpu",         "rdtscp",               True),
+    ("Broadwell-noTSX-x86_64-cpu", "rdtscp",               True),
+    ("Broadwell-x86_64-cpu",       "rdtscp",               True),
+    ("Opteron_G2-x86_64-cpu",      "rdtscp",               True),
+    ("Opteron_G3-x86_64-cpu",      "rdtscp",               True),
+    ("Opteron_G4-x86_64-cpu",      "rdtscp",               True),
+    ("Opteron_G5-x86_64-cpu",      "rdtscp",               True),
+
+    ('virtio-pci',           'x-pcie-pm-init',                False),
+    ('virtio-pci',           'x-pcie-lnkctl-init',            False),
+    ('virtio-pci',           'x-pcie-deverr-init',            False),
+    ('virtio-pci',           'x-ignore-backend-features',      True),
+    ('virtio-pci',           'x-disable-pcie',                 True),
+    ('virtio-pci',           'virtio-pci-bus-master-bug-migration', True),
+    ('virtio-pci',           'page-per-vq',                    True),
+    ('virtio-pci',           'migrate-extra',                 False),
+    ('virtio-pci',           'disable-modern',                 True),
+    ('virtio-pci',           'disable-legacy',                False),
+    # commit f58b39d2d5b6dea1a757e1dc7d67a44eac1c4f9c
+    ('virtio-mmio',          'format_transport_address',      False),
+    ('virtio-serial-device', 'emergency-write',               False),
+    ('virtio-net-pci',       'guest_announce',                False),
+    ('virtio-net-pci',       'ctrl_guest_offloads',           False),
+    # note that "any_layout" is registered at virtio-device, but
+    # alias properties are registered at virtio-pci subclasses.
+    # the compat_props properties, on the other hand, are set
+    # at the virtio-pci subclasses, so provide the omitted-proerty
+    # value for virtio-pci too.
+    ('virtio-device',        'any_layout',                    False),
+    ('virtio-pci',           'any_layout',                    False),
+    # commit a4c0d1deb785611c96a455f65ec032976b00b36f:
+    ('fw_cfg',               'dma_enabled',                   False),
+    ('fw_cfg_io',            'x-file-slots',                   0x10),
+    ('fw_cfg_mem',           'x-file-slots',                   0x10),
+    ('intel-iommu',          'x-buggy-eim',                    True),
+    ('kvmclock',             'x-mach-use-reliable-get-clock', False),
+    ('xio3130-downstream',   'power_controller_present',      False),
+    ('ioh3420',              'power_controller_present',      False),
+    ('vmxnet3',              'x-disable-pcie',                 True),
+    # commit b22e0aef462df40e3355ee1cdf707b9578d23706:
+    ('vmxnet3',              'x-old-msi-offsets',              True),
+    ('VGA',                  'qemu-extended-regs',            False),
+    ('usb-redir',            'streams',                       False),
+    ('usb-mouse',            'usb_version',                       1),
+    ('usb-kbd',              'usb_version',                       1),
+    ('ICH9-LPC',             'memory-hotplug-support',        False),
+    ('PIIX4_PM',             'memory-hotplug-support',        False),
+    ('PIIX4_PM',             'acpi-pci-hotplug-with-bridge-support', False),
+    ('pci-serial',           'prog_if',                           0),
+    ('pci-serial-2x',        'prog_if',                           0),
+    ('pci-serial-4x',        'prog_if',                           0),
+    ('nec-usb-xhci',         'superspeed-ports-first',        False),
+    ('nec-usb-xhci',         'force-pcie-endcap',              True),
+    ('apic-common',          'legacy-instance-id',             True),
+    ('apic-common',          'version',                        0x11),
+    ('ioapic',               'version',                        0x11),
+    ('isa-fdc',              'fallback',                      '144'),
+    # we can't use intel-hda-generic here, because some QEMU versions
+    # didn't have a common intel-hda-generic class
+    ('intel-hda',            'old_msi_addr',                   True),
+    ('ich9-intel-hda',       'old_msi_addr',                   True),
+    ('e1000',                'mitigation',                    False),
+    ('e1000-82540em',        'mitigation',                    False),
+    ('e1000',                'extra_mac_registers',           False),
+    ('e1000-82540em',        'extra_mac_registers',           False),
+    ('pci-bridge',           'shpc',                           True),
+    # commit 5e89dc01133f8f5e621f6b66b356c6f37d31dafb:
+    ('i82559a',              'x-use-alt-device-id',           False),
+    # commit 9fa99d2519cbf71f871e46871df12cb446dc1c3e:
+    ('i440FX-pcihost',       'x-pci-hole64-fix',              False),
+    ('q35-pcihost',          'x-pci-hole64-fix',              False),
+    # commit f4924974c7c72560f68ab298ac25a525a28a2124:
+    ('virtio-mouse-device',  'wheel-axis',                    False),
+    ('virtio-tablet-device', 'wheel-axis',                    False),
+    # commit 75ebec11afe49539f71cc1c494e3010f91c86adb:
+    ('virtio-net-device',    'x-mtu-bypass-backend',          False),
+    # commit bc277a52fbea1532d1adf30ba0edf15ab3dcdead:
+    ('pcie-root-port',       'x-migrate-msix',                False),
+    # commit 2f295167e0c429cec233aef7dc8e9fd6f90376df:
+    ('mch',                  'extended-tseg-mbytes',              0),
+    # commit dbaabb25f441264d9029dc53e84a156269ecd275:
+    ('intel-iommu',          'pt',                            False),
+    ('amd-iommu',            'pt',                            False),
+    # commit b8bab8eb6934cbf6577a18a9c5657d7707379ac0:
+    ('ICH9-LPC',             'x-smi-broadcast',               False),
+    # commit 952970ba5651e8f6d1fec7de0366c63a79cadfdb:
+    ('pvscsi',               'x-old-pci-configuration',        True),
+    # commit d5da3ef2e24c29ddb92e11a54d705873acb905bf:
+    ('pvscsi',               'x-disable-pcie',                 True),
+    # commit 829600a519386c7b188d5d813e78ba69bf0bd323
+    ('hpet',                 'hpet-offset-saved',             False),
+
+    #XXX: this probably doesn't match the upstream QEMU behavior,
+    #     but we probably will never compare machine-types containing
+    #     those __redhat_* properties with upstream machine-types
+    #     directly, anyway
+    ('rtl8139',              '__redhat_send_rxokmul',         False),
+    ('e1000e',               '__redhat_e1000e_7_3_intr_state', True),
+    ('ICH9-LPC',             '__com.redhat_force-rev1-fadt',   True),
+)
+
+# OMITTED_PROP_VALUES in the compat_props format expected by apply_compat_props():
+OMITTED_COMPAT_PROPS = tuple(dict(driver=d, property=p, value=v) for (d, p, v) in OMITTED_PROP_VALUES)
+
 def build_omitted_prop_dict(binary):
     """Build list of property values for non-existing properties
 
@@ -447,261 +1064,8 @@ def build_omitted_prop_dict(binary):
     will contain the value required to emulate the behavior QEMU had when
     the property didn't exist yet.
     """
-    OMITTED_PROP_VALUES = [
-        ('pci-device',           'x-pcie-extcap-init',            False),
-        ('pci-device',           'x-pcie-lnksta-dllla',           False),
-        ('x86_64-cpu',           'kvm-no-smi-migration',           True),
-        ('i386-cpu',             'kvm-no-smi-migration',           True),
-        ('x86_64-cpu',           'full-cpuid-auto-level',         False),
-        ('i386-cpu',             'full-cpuid-auto-level',         False),
-        # tcg-cpuid implemented by commit 1ce36bfe6424243082d3d7c2330e1a0a4ff72a43:
-        ('x86_64-cpu',           'tcg-cpuid',         False),
-        ('i386-cpu',             'tcg-cpuid',         False),
-        ('x86_64-cpu',           'cpuid-0xb',                     False),
-        ('i386-cpu',             'cpuid-0xb',                     False),
-        ('x86_64-cpu',           'l3-cache',                      False),
-        ('i386-cpu',             'l3-cache',                      False),
-        ('x86_64-cpu',           'fill-mtrr-mask',                False),
-        ('i386-cpu',             'fill-mtrr-mask',                False),
-        # commit 6c69dfb67e84747cf071958594d939e845dfcc0c:
-        ('x86_64-cpu',           'x-hv-max-vps', 0x40),
-        ('i386-cpu',             'x-hv-max-vps', 0x40),
-        # commit 9954a1582e18b03ddb66f6c892dccf2c3508f4b2:
-        ('x86_64-cpu',           'vmware-cpuid-freq',             False),
-        ('i386-cpu',             'vmware-cpuid-freq',             False),
-        # commit e265e3e48049fbece9eaf536aa00ca41aa3c54d0:
-        ('x86_64-cpu',           'host-cache-info',                True),
-        ('i386-cpu',             'host-cache-info',                True),
-        # CPU feature flags that were always off when we introduced them:
-        ('x86_64-cpu',           'arat',                          False),
-        ('i386-cpu',             'arat',                          False),
-        ('x86_64-cpu',           'rdrand',                        False),
-        ('i386-cpu',             'rdrand',                        False),
-        ('x86_64-cpu',           'f16c',                          False),
-        ('i386-cpu',             'f16c',                          False),
-
-        # * VMX was disabled on all CPU models when we added CPU
-        #   feature properties (commit 38e5c119c2925812bd441450ab9e5e00fc79e662
-        #   v2.4.0-rc0~101^2~1).
-        # * However, it was enabled on core2duo and coreduo between
-        #   commit 8560efed6a72a816c0115f41ddb9d79f7ce63f28 (v0.13.0-rc0~1093)
-        #   and commit e93abc147fa628650bdbe7fd57f27462ca40a3c2 (v2.2.0-rc0~5^2~1).
-        # * Probably it is possible to work around this by looking at
-        #   the "feature-words" property
-        #('x86_64-cpu',           'vmx',                           ???),
-        #('i386-cpu',             'vmx',                           ???),
-
-        # * VME was already enabled on all CPU models when we added CPU
-        #   feature properties (commit 38e5c119c2925812bd441450ab9e5e00fc79e662
-        #   v2.4.0-rc0~101^2~1).
-        # * However, VME was always disabled on TCG mode and this wasn't
-        #   reported throught the QOM properties until
-        #   commit 04d99c3c61f4bdc0450dbeb6512b6dd743baca65 (v2.8.0-rc0~74^2~18)
-        # * To make it worse, VME was disabled on all CPU models until
-        #   commit b3a4f0b1a072a467d003755ca0e55c5be38387cb (v2.3.0-rc0~137^2~13),
-        # * Probably it is possible to work around this by looking at
-        #   the "feature-words" property
-        #('x86_64-cpu',           'vme',                          ???),
-        #('i386-cpu',             'vme',                          ???),
-
-        # * ABM was already enabled on qemu64, phenom, kvm64, Opteron_G3,
-        #   Opteron_G4, and Opteron_G5 when we added CPU feature properties
-        #   (commit 38e5c119c2925812bd441450ab9e5e00fc79e662 v2.4.0-rc0~101^2~1)
-        # * Note that we have removed ABM from qemu64 on
-        #   commit 711956722c6764336f8b78a2106e57c55f02f36d (v2.5.0-rc0~28^2~2),
-        #   but this should be handled properly because CPU featur properties
-        #   were already available in QEMU 2.4.0
-        #
-        # the default:
-        ('x86_64-cpu',            'abm',                        False),
-        ('i386-cpu',              'abm',                        False),
-        # these below override the default above:
-        ('qemu64-x86_64-cpu',     'abm',                         True),
-        ('qemu64-i386-cpu',       'abm',                         True),
-        ('phenom-x86_64-cpu',     'abm',                         True),
-        ('phenom-i386-cpu',       'abm',                         True),
-        ('kvm64-x86_64-cpu',      'abm',                         True),
-        ('kvm64-i386-cpu',        'abm',                         True),
-        ('Opteron_G3-x86_64-cpu', 'abm',                         True),
-        ('Opteron_G3-i386-cpu',   'abm',                         True),
-        ('Opteron_G4-x86_64-cpu', 'abm',                         True),
-        ('Opteron_G4-i386-cpu',   'abm',                         True),
-        ('Opteron_G5-x86_64-cpu', 'abm',                         True),
-        ('Opteron_G5-i386-cpu',   'abm',                         True),
-
-        # * SSE4A was already enabled on qemu64, phenom, kvm64, Opteron_G3,
-        #   Opteron_G4, and Opteron_G5 when we added CPU feature properties
-        #   (commit 38e5c119c2925812bd441450ab9e5e00fc79e662 v2.4.0-rc0~101^2~1)
-        # the default:
-        ('x86_64-cpu',            'sse4a',                      False),
-        ('i386-cpu',              'sse4a',                      False),
-        # these below override the default above:
-        ('qemu64-x86_64-cpu',     'sse4a',                       True),
-        ('qemu64-i386-cpu',       'sse4a',                       True),
-        ('phenom-x86_64-cpu',     'sse4a',                       True),
-        ('phenom-i386-cpu',       'sse4a',                       True),
-        ('kvm64-x86_64-cpu',      'sse4a',                       True),
-        ('kvm64-i386-cpu',        'sse4a',                       True),
-        ('Opteron_G3-x86_64-cpu', 'sse4a',                       True),
-        ('Opteron_G3-i386-cpu',   'sse4a',                       True),
-        ('Opteron_G4-x86_64-cpu', 'sse4a',                       True),
-        ('Opteron_G4-i386-cpu',   'sse4a',                       True),
-        ('Opteron_G5-x86_64-cpu', 'sse4a',                       True),
-        ('Opteron_G5-i386-cpu',   'sse4a',                       True),
-
-        # * POPCNT was already enabled on many CPU models when we added CPU feature
-        #   properties (commit 38e5c119c2925812bd441450ab9e5e00fc79e662
-        #   v2.4.0-rc0~101^2~1)
-        #
-        # the default:
-        ('x86_64-cpu',                 'popcnt',                False),
-        ('i386-cpu',                   'popcnt',                False),
-        # these below override the default above:
-        ("qemu64-x86_64-cpu",          "popcnt",                 True),
-        ("qemu64-i386-cpu",            "popcnt",                 True),
-        ("phenom-x86_64-cpu",          "popcnt",                 True),
-        ("phenom-i386-cpu",            "popcnt",                 True),
-        ("qemu32-x86_64-cpu",          "popcnt",                 True),
-        ("qemu32-i386-cpu",            "popcnt",                 True),
-        ("Nehalem-x86_64-cpu",         "popcnt",                 True),
-        ("Nehalem-i386-cpu",           "popcnt",                 True),
-        ("Westmere-x86_64-cpu",        "popcnt",                 True),
-        ("Westmere-i386-cpu",          "popcnt",                 True),
-        ("SandyBridge-x86_64-cpu",     "popcnt",                 True),
-        ("SandyBridge-i386-cpu",       "popcnt",                 True),
-        ("IvyBridge-x86_64-cpu",       "popcnt",                 True),
-        ("IvyBridge-i386-cpu",         "popcnt",                 True),
-        ("Haswell-noTSX-x86_64-cpu",   "popcnt",                 True),
-        ("Haswell-noTSX-i386-cpu",     "popcnt",                 True),
-        ("Haswell-x86_64-cpu",         "popcnt",                 True),
-        ("Haswell-i386-cpu",           "popcnt",                 True),
-        ("Broadwell-noTSX-x86_64-cpu", "popcnt",                 True),
-        ("Broadwell-noTSX-i386-cpu",   "popcnt",                 True),
-        ("Broadwell-x86_64-cpu",       "popcnt",                 True),
-        ("Broadwell-i386-cpu",         "popcnt",                 True),
-        ("Opteron_G3-x86_64-cpu",      "popcnt",                 True),
-        ("Opteron_G3-i386-cpu",        "popcnt",                 True),
-        ("Opteron_G4-x86_64-cpu",      "popcnt",                 True),
-        ("Opteron_G4-i386-cpu",        "popcnt",                 True),
-        ("Opteron_G5-x86_64-cpu",      "popcnt",                 True),
-        ("Opteron_G5-i386-cpu",        "popcnt",                 True),
-
-
-        # * RDTSCP was already enabled on many CPU models when we added CPU feature
-        #   properties (commit 38e5c119c2925812bd441450ab9e5e00fc79e662
-        #   v2.4.0-rc0~101^2~1)
-        #
-        # the default:
-        ('x86_64-cpu',                 'rdtscp',              False),
-        ('i386-cpu',                   'rdtscp',              False),
-        # these below override the default above:
-        ("phenom-x86_64-cpu",          "rdtscp",               True),
-        ("SandyBridge-x86_64-cpu",     "rdtscp",               True),
-        ("IvyBridge-x86_64-cpu",       "rdtscp",               True),
-        ("Haswell-noTSX-x86_64-cpu",   "rdtscp",               True),
-        ("Haswell-x86_64-cpu",         "rdtscp",               True),
-        ("Broadwell-noTSX-x86_64-cpu", "rdtscp",               True),
-        ("Broadwell-x86_64-cpu",       "rdtscp",               True),
-        ("Opteron_G2-x86_64-cpu",      "rdtscp",               True),
-        ("Opteron_G3-x86_64-cpu",      "rdtscp",               True),
-        ("Opteron_G4-x86_64-cpu",      "rdtscp",               True),
-        ("Opteron_G5-x86_64-cpu",      "rdtscp",               True),
-
-        ('virtio-pci',           'x-pcie-pm-init',                False),
-        ('virtio-pci',           'x-pcie-lnkctl-init',            False),
-        ('virtio-pci',           'x-pcie-deverr-init',            False),
-        ('virtio-pci',           'x-ignore-backend-features',      True),
-        ('virtio-pci',           'x-disable-pcie',                 True),
-        ('virtio-pci',           'virtio-pci-bus-master-bug-migration', True),
-        ('virtio-pci',           'page-per-vq',                    True),
-        ('virtio-pci',           'migrate-extra',                 False),
-        ('virtio-pci',           'disable-modern',                 True),
-        ('virtio-pci',           'disable-legacy',                False),
-        # commit f58b39d2d5b6dea1a757e1dc7d67a44eac1c4f9c
-        ('virtio-mmio',          'format_transport_address',      False),
-        ('virtio-serial-device', 'emergency-write',               False),
-        ('virtio-net-pci',       'guest_announce',                False),
-        ('virtio-net-pci',       'ctrl_guest_offloads',           False),
-        # note that "any_layout" is registered at virtio-device, but
-        # alias properties are registered at virtio-pci subclasses.
-        # the compat_props properties, on the other hand, are set
-        # at the virtio-pci subclasses, so provide the omitted-proerty
-        # value for virtio-pci too.
-        ('virtio-device',        'any_layout',                    False),
-        ('virtio-pci',           'any_layout',                    False),
-        # commit a4c0d1deb785611c96a455f65ec032976b00b36f:
-        ('fw_cfg',               'dma_enabled',                   False),
-        ('fw_cfg_io',            'x-file-slots',                   0x10),
-        ('fw_cfg_mem',           'x-file-slots',                   0x10),
-        ('intel-iommu',          'x-buggy-eim',                    True),
-        ('kvmclock',             'x-mach-use-reliable-get-clock', False),
-        ('xio3130-downstream',   'power_controller_present',      False),
-        ('ioh3420',              'power_controller_present',      False),
-        ('vmxnet3',              'x-disable-pcie',                 True),
-        # commit b22e0aef462df40e3355ee1cdf707b9578d23706:
-        ('vmxnet3',              'x-old-msi-offsets',              True),
-        ('VGA',                  'qemu-extended-regs',            False),
-        ('usb-redir',            'streams',                       False),
-        ('usb-mouse',            'usb_version',                       1),
-        ('usb-kbd',              'usb_version',                       1),
-        ('ICH9-LPC',             'memory-hotplug-support',        False),
-        ('PIIX4_PM',             'memory-hotplug-support',        False),
-        ('PIIX4_PM',             'acpi-pci-hotplug-with-bridge-support', False),
-        ('pci-serial',           'prog_if',                           0),
-        ('pci-serial-2x',        'prog_if',                           0),
-        ('pci-serial-4x',        'prog_if',                           0),
-        ('nec-usb-xhci',         'superspeed-ports-first',        False),
-        ('nec-usb-xhci',         'force-pcie-endcap',              True),
-        ('apic-common',          'legacy-instance-id',             True),
-        ('apic-common',          'version',                        0x11),
-        ('ioapic',               'version',                        0x11),
-        ('isa-fdc',              'fallback',                      '144'),
-        # we can't use intel-hda-generic here, because some QEMU versions
-        # didn't have a common intel-hda-generic class
-        ('intel-hda',            'old_msi_addr',                   True),
-        ('ich9-intel-hda',       'old_msi_addr',                   True),
-        ('e1000',                'mitigation',                    False),
-        ('e1000-82540em',        'mitigation',                    False),
-        ('e1000',                'extra_mac_registers',           False),
-        ('e1000-82540em',        'extra_mac_registers',           False),
-        ('pci-bridge',           'shpc',                           True),
-        # commit 5e89dc01133f8f5e621f6b66b356c6f37d31dafb:
-        ('i82559a',              'x-use-alt-device-id',           False),
-        # commit 9fa99d2519cbf71f871e46871df12cb446dc1c3e:
-        ('i440FX-pcihost',       'x-pci-hole64-fix',              False),
-        ('q35-pcihost',          'x-pci-hole64-fix',              False),
-        # commit f4924974c7c72560f68ab298ac25a525a28a2124:
-        ('virtio-mouse-device',  'wheel-axis',                    False),
-        ('virtio-tablet-device', 'wheel-axis',                    False),
-        # commit 75ebec11afe49539f71cc1c494e3010f91c86adb:
-        ('virtio-net-device',    'x-mtu-bypass-backend',          False),
-        # commit bc277a52fbea1532d1adf30ba0edf15ab3dcdead:
-        ('pcie-root-port',       'x-migrate-msix',                False),
-        # commit 2f295167e0c429cec233aef7dc8e9fd6f90376df:
-        ('mch',                  'extended-tseg-mbytes',              0),
-        # commit dbaabb25f441264d9029dc53e84a156269ecd275:
-        ('intel-iommu',          'pt',                            False),
-        ('amd-iommu',            'pt',                            False),
-        # commit b8bab8eb6934cbf6577a18a9c5657d7707379ac0:
-        ('ICH9-LPC',             'x-smi-broadcast',               False),
-        # commit 952970ba5651e8f6d1fec7de0366c63a79cadfdb:
-        ('pvscsi',               'x-old-pci-configuration',        True),
-        # commit d5da3ef2e24c29ddb92e11a54d705873acb905bf:
-        ('pvscsi',               'x-disable-pcie',                 True),
-        # commit 829600a519386c7b188d5d813e78ba69bf0bd323
-        ('hpet',                 'hpet-offset-saved',             False),
-
-        #XXX: this probably doesn't match the upstream QEMU behavior,
-        #     but we probably will never compare machine-types containing
-        #     those __redhat_* properties with upstream machine-types
-        #     directly, anyway
-        ('rtl8139',              '__redhat_send_rxokmul',         False),
-        ('e1000e',               '__redhat_e1000e_7_3_intr_state', True),
-        ('ICH9-LPC',             '__com.redhat_force-rev1-fadt',   True),
-    ]
-
     r = {}
-    apply_compat_props(binary, '<omitted-props>', r, (dict(driver=d, property=p, value=v) for (d, p, v) in OMITTED_PROP_VALUES))
+    apply_compat_props(binary, '<omitted-props>', r, OMITTED_COMPAT_PROPS)
 
     #XXX: this one can't be solved without looking at other information:
     # Between commit 39c88f56977f9ad2451444d70dd21d8189d74f99 (v2.8.0-rc0~137^2)
@@ -728,18 +1092,23 @@ def build_omitted_prop_dict(binary):
 
     return r
 
+CPU_LEVEL_PROPS = frozenset(['level', 'xlevel'])
+CPU_MIN_LEVEL_PROPS = frozenset(['min-level', 'min-xlevel'])
+# CPU models whose model-id is set by x86_cpudef_setup():
+CPUDEF_SETUP_MODEL_ID_CPUS = frozenset(['qemu64-x86_64-cpu', 'qemu32-x86_64-cpu', 'athlon-x86_64-cpu',
+                                        'qemu64-i386-cpu', 'qemu32-i386-cpu', 'athlon-i386-cpu'])
+
 def fixup_prop_value(ctx, compat, devtype, propname, v):
     # On some QEMU versions, the QInt conversion done by gdb-extract-qemu-info.py
     # reads level/xlevel as int32_t values instead of uint32_t:
-    if devtype.endswith('-cpu') and propname in ['level', 'xlevel'] and v is not None:
+    if propname in CPU_LEVEL_PROPS and v is not None and devtype.endswith('-cpu'):
         return int(v) & 0xFFFFFFFF
-    if devtype.endswith('-cpu') and propname in ['min-level', 'min-xlevel'] and v is None:
+    if propname in CPU_MIN_LEVEL_PROPS and v is None and devtype.endswith('-cpu'):
         # if min-level/min-xlevel is not known, just use level/xlevel:
         lprop = propname.split('-')[1]
         return calculate_prop_value(ctx, compat, devtype, lprop)[1]
-    if devtype in ['qemu64-x86_64-cpu', 'qemu32-x86_64-cpu', 'athlon-x86_64-cpu', \
-                   'qemu64-i386-cpu', 'qemu32-i386-cpu', 'athlon-i386-cpu'] and \
-       propname == 'model-id' and v == '':
+    if propname == 'model-id' and v == '' and \
+       devtype in CPUDEF_SETUP_MODEL_ID_CPUS:
         # workaround for gdb-extract-qemu-info.py limitation: x86_cpudef_setup()
         # called too late and won't run before we extract property info
         ver = ctx.binary1.qemu_version()
@@ -751,14 +1120,14 @@ def fixup_prop_value(ctx, compat, devtype, propname, v):
 def calculate_prop_value(ctx, compat, devtype, propname):
     """Try to find out what's going to be the default value for a property"""
 
-    omitted1 = build_omitted_prop_dict(ctx.binary1)
+    omitted1 = ctx.binary1.omitted_props()
 
     ctx.log(DEBUG, "calculating default value for %s.%s", devtype, propname)
     dt = ctx.binary1.get_devtype(devtype)
     dbg("dt: %s", dt and dt.get('type'))
-    pi = get_devtype_property_info(dt, propname)
+    pi = get_devtype_property_info(ctx.binary1, devtype, propname)
     dbg("pi: %s", pi)
-    v = compat.get(devtype, {}).get(propname)
+    v = get_compat_prop(compat, devtype, propname)
     dbg("v: %r", v)
 
     # we have a problem if:
@@ -770,9 +1139,9 @@ def calculate_prop_value(ctx, compat, devtype, propname):
         v = parse_property_value(pi, v)
     elif v is not None and dt is not None:
         if devtype_has_full_prop_info(dt):
-            ctx.report_result(ERROR, "Invalid property: %s.%s" % (devtype, propname))
+            ctx.report_result(ERROR, "Invalid property: %s.%s", devtype, propname)
         else:
-            ctx.report_result(WARN, "Not enough info to validate property: %s.%s" % (devtype, propname))
+            ctx.report_result(WARN, "Not enough info to validate property: %s.%s", devtype, propname)
 
     dbg("parsed v: %r", v)
 
@@ -786,7 +1155,7 @@ def calculate_prop_value(ctx, compat, devtype, propname):
     # if we still don't know what was the default value because the property
     # is not known, lookup the omitted-properties dictionary
     if v is None and pi is None:
-        v = omitted1.get(devtype, {}).get(propname)
+        v = get_compat_prop(omitted1, devtype, propname)
 
     dbg("omitted v: %r", v)
 
@@ -796,7 +1165,7 @@ def calculate_prop_value(ctx, compat, devtype, propname):
     if v is None and dt is not None:
         # warn about not knowing the actual default value only if the device type is
         # really supported by the machine-type
-        ctx.report_result(WARN, "I don't know the default value of %s.%s" % (devtype, propname))
+        ctx.report_result(WARN, "I don't know the default value of %s.%s", devtype, propname)
 
     return pi, v
 
@@ -813,62 +1182,75 @@ def compare_machine_compat_props(args, ctx, m1, m2):
     if args.devices:
         devices_to_check = set(args.devices)
     else:
-        devices_to_check = set(compat1.keys() + compat2.keys())
+        devices_to_check = set(compat1).union(compat2)
     if args.all_devices:
         devices_to_check.update(b1.all_devtypes())
         devices_to_check.update(b2.all_devtypes())
 
+    b1_ctx = ctx.b1_ctx()
+    b2_ctx = ctx.b2_ctx()
     for d in devices_to_check:
+        c1 = compat1.get(d)
+        c2 = compat2.get(d)
+        if c1 is None and c2 is None:
+            # no compat_props for this device type, nothing to compare
+            continue
         #TODO: add option to compare all properties, not just the ones on compat_checker
-        for p in set(compat1.get(d, {}).keys() + compat2.get(d, {}).keys()):
-            pi1, v1 = calculate_prop_value(ctx.b1_ctx(), compat1, d, p)
-            pi2, v2 = calculate_prop_value(ctx.b2_ctx(), compat2, d, p)
+        for p in set(c1 or ()).union(c2 or ()):
+            pi1, v1 = calculate_prop_value(b1_ctx, compat1, d, p)
+            pi2, v2 = calculate_prop_value(b2_ctx, compat2, d, p)
 
             if v1 is None or v2 is None:
                 # we can't compare something we don't know about
                 pass
             elif not compare_properties(pi1, v1, pi2, v2):
-                ctx.report_result(ERROR, "difference at %s.%s (%r != %r)" % (d, p, v1, v2))
+                ctx.report_result(ERROR, "difference at %s.%s (%r != %r)", d, p, v1, v2)
             else:
-                ctx.report_result(DEBUG, "%s.%s is OK: %r == %r" % (d, p, v1, v2))
+                ctx.report_result(DEBUG, "%s.%s is OK: %r == %r", d, p, v1, v2)
 
 
 # we can't use None to indicate unknown value, because we can
 # really have fields set to NULL
 UNKNOWN_VALUE = object()
 
+# marker for fields not present in a machine dict:
+MISSING_FIELD = object()
+
+# static values for MachineClass fields, used by get_omitted_machine_field():
+OMITTED_MACHINE_FIELDS = {
+    'minimum_page_bits': 0,
+    'numa_mem_align_shift': 23,
+    'default_ram_size': 128 * 1024*1024,
+    'auto_enable_numa_with_memhp': False,
+
+    'units_per_default_bus': 0,
+    'default_display': None,
+    'pci_allow_0_address': 0,
+    'legacy_fw_cfg_order': 1,
+
+    'min_cpus': 0,
+    'max_cpus': 0,
+    'default_cpus': 0,
+
+    'ignore_memory_transaction_failures': False,
+    'valid_cpu_types': None,
+}
+
 def get_omitted_machine_field(m, field):
     """Returns what value should be present in a MachineClass struct field
     to emulate QEMU's behavior when the field didn't exist yet
     """
-    OMITTED_MACHINE_FIELDS = {
-        'minimum_page_bits': 0,
-        'numa_mem_align_shift': 23,
-        'default_ram_size': 128 * 1024*1024,
-        'auto_enable_numa_with_memhp': False,
-
-        # default_boot_order and boot_order are equivalent:
-        'default_boot_order': m.get('boot_order', UNKNOWN_VALUE),
-        'boot_order': m.get('default_boot_order', UNKNOWN_VALUE),
-
-        'units_per_default_bus': 0,
-        'has_dynamic_sysbus': 0,
-        'default_display': None,
-        'pci_allow_0_address': 0,
-        'legacy_fw_cfg_order': 1,
-
-        'min_cpus': 0,
-        'max_cpus': 0,
-        'default_cpus': 0,
-
-        'ignore_memory_transaction_failures': False,
-        'valid_cpu_types': None,
-
-        # translate allowed_dynamic_sysbus_devices and has_dynamic_sysbus:
-        'allowed_dynamic_sysbus_devices': (['sys-bus-device'] if m.get('has_dynamic_sysbus') else []),
+    # default_boot_order and boot_order are equivalent:
+    if field == 'default_boot_order':
+        return m.get('boot_order', UNKNOWN_VALUE)
+    elif field == 'boot_order':
+        return m.get('default_boot_order', UNKNOWN_VALUE)
+    # translate allowed_dynamic_sysbus_devices and has_dynamic_sysbus:
+    elif field == 'allowed_dynamic_sysbus_devices':
+        return (['sys-bus-device'] if m.get('has_dynamic_sysbus') else [])
+    elif field == 'has_dynamic_sysbus':
         #FIXME: gdb-extract-qemu-info.py doesn't translate strList, returns just {}
-        'has_dynamic_sysbus': (1 if m.get('allowed_dynamic_sysbus_devices') is not None else 0),
-    }
+        return (1 if m.get('allowed_dynamic_sysbus_devices') is not None else 0)
 
     return OMITTED_MACHINE_FIELDS.get(field, UNKNOWN_VALUE)
 
@@ -877,12 +1259,19 @@ def parse_opts(s):
         raise Exception("I don't know how to parse escaped commas on QemuOpts")
     return dict(v.split('=', 1) for v in s.split(','))
 
+# fields that don't matter for -machine none:
+MACHINE_NONE_IGNORED_FIELDS_RE = re.compile(r'(|default_)boot_order|default_ram_size|block_default_type')
+# PC machine-types, where default_cpu_type can be omitted:
+PC_MACHINE_RE = re.compile(r'pc-.*|rhel[67]\..*')
+# function name in a function pointer value:
+FUNC_NAME_RE = re.compile(r'<([^>]*)>')
+
 def fixup_machine_field(ctx, m, field, v):
     """Fixup some machine fields when the info we have might be wrong or generate false positives"""
 
     mname = m.get('name', '')
     if mname == 'none' and \
-         re.match('(|default_)boot_order|default_ram_size|block_default_type', field):
+         MACHINE_NONE_IGNORED_FIELDS_RE.match(field):
         # those fields don't matter for -machine none at all
         return None
     elif field == 'default_display' and v is None:
@@ -897,7 +1286,7 @@ def fixup_machine_field(ctx, m, field, v):
     elif field == 'default_cpus' and v == 0:
         # default_cpus == 0 is the same as default_cpus == 1
         return 1
-    elif field == 'default_cpu_type' and v is UNKNOWN_VALUE and re.match('pc-.*|rhel[67]\..*', mname):
+    elif field == 'default_cpu_type' and v is UNKNOWN_VALUE and PC_MACHINE_RE.match(mname):
         for t in ['qemu64-x86_64-cpu', 'qemu64-i386-cpu']:
             if ctx.binary1.get_devtype(t):
                 return t
@@ -915,137 +1304,135 @@ def fixup_machine_field(ctx, m, field, v):
         dbg("qemu version: %r", qemu_ver)
         if qemu_ver is None:
             return v
-        ver_numbers = map(int, qemu_ver.split('.')) # '2.3.0' -> [2, 3, 0]
-        if ver_numbers[:2] > [2, 4]:
-            dbg('%r > [2, 4]', ver_numbers[:2])
+        ver_numbers = ctx.binary1.qemu_version_numbers() # '2.3.0' -> (2, 3, 0)
+        if ver_numbers[:2] > (2, 4):
+            dbg('%r > (2, 4)', ver_numbers[:2])
             v = '2.5+'
         else:
             v = qemu_ver
         return v
     return v
 
-def compare_machine_simple_fields(args, ctx, m1, m2):
-    b1 = ctx.binary1
-    b2 = ctx.binary2
-    machinename = ctx.machinename
+# machine field comparison functions.  They get the validation context,
+# the field name, and the two values being compared:
 
-    # our comparison functions:
-    def simple_compare(v1, v2):
-        if v1 is UNKNOWN_VALUE:
-            ctx.report_result(WARN, "%s: I don't know how to deal with missing machine.%s field" % (b1, f))
-            return
-        if v2 is UNKNOWN_VALUE:
-            ctx.report_result(WARN, "%s: I don't know how to deal with missing machine.%s field" % (b2, f))
-            return
-        return v1 == v2
+def simple_compare(ctx, f, v1, v2):
+    if v1 is UNKNOWN_VALUE:
+        ctx.report_result(WARN, "%s: I don't know how to deal with missing machine.%s field", ctx.binary1, f)
+        return
+    if v2 is UNKNOWN_VALUE:
+        ctx.report_result(WARN, "%s: I don't know how to deal with missing machine.%s field", ctx.binary2, f)
+        return
+    return v1 is v2 or v1 == v2
 
-    def ensure_v2_ge(v1, v2):
-        """Ensure v2 is greater or equal to v1.  Useful when a property representes a limit, not a ABI-visible value"""
-        if v1 is UNKNOWN_VALUE:
-            ctx.report_result(WARN, "%s: I don't know how to deal with missing machine.%s field" % (b1, f))
-            return
-        if v2 is UNKNOWN_VALUE:
-            ctx.report_result(WARN, "%s: I don't know how to deal with missing machine.%s field" % (b2, f))
-            return
-        return v2 >= v1
-
-
-    def ignore_unknown_value(v1, v2):
-        """Compare values, but don't print a warning if we don't know one of them"""
-        return (v1 is UNKNOWN_VALUE) or (v2 is UNKNOWN_VALUE) or (v1 == v2)
-
-    def compare_func_name(v1, v2):
-        func_re = re.compile('<([^>]*)>')
-        fname1 = v1 and func_re.search(v1).group(1)
-        fname2 = v2 and func_re.search(v2).group(1)
-        return fname1 == fname2
-
-    def compare_nullness(v1, v2):
-        """Just check if both values are NULL or non-NULL"""
-        return (v1 is None) == (v2 is None)
-
-    def compare_sysbus_list(v1, v2):
-        """The allowed sysbus list is allowed to grow, not shrink"""
-        #FIXME: gdb-extract-qemu-info.py doesn't translate strList, returns just {},
-        #       so all we can do is to check if the list didn't become empty
-        v1empty = v1 is None or v1 == []
-        v2empty = v2 is None or v2 == []
-        return v1empty or not v2empty
-
-    fields = set(m1.keys() + m2.keys())
-
-    KNOWN_FIELDS = {
-        # compat_props is checked separately by compare_machine_compat_props()
-        'compat_props': None,
-
-        # there's no easy way to support these fields on get_omitted_machine_field()
-        # because when the MachineClass fields were introduced
-        # (commit 71ae9e94d99240cd02926ad76fadb4963a873b09), some machine-types
-        # set them to true and others set them to false
-        'option_rom_has_mr': ignore_unknown_value,
-        'rom_file_has_mr': ignore_unknown_value,
-
-        # max_cpus doesn't need to match exactly: we just need it to be greater or equal
-        'max_cpus': ensure_v2_ge,
-        # has_dynamic_sybus can also change from 0 to 1, but not the other way around:
-        'has_dynamic_sysbus': ensure_v2_ge,
-        'allowed_dynamic_sysbus_devices': compare_sysbus_list,
-
-        # things we skip and won't try to validate:
-
-        #TODO: this script doesn't know yet how to compare hotpluggable-CPUs
-        # data between different QEMU versions
-        'query_hotpluggable_cpus': None,
-        'has_hotpluggable_cpus': None,
-        #TODO: script doesn't know what to do with 'reset' function pointer, either:
-        'reset': None,
-        #TODO: other functions we don't know how to compare:
-        'hot_add_cpu': None,
-        'init': None,
-        'get_hotplug_handler': None,
-        'possible_cpu_arch_ids': None,
-        'cpu_index_to_socket_id': None,
-        'cpu_index_to_instance_props': None,
-        'numa_auto_assign_ram': None,
-        'kvm_type': None,
-        'get_default_cpu_node_id': None,
-
-        # alias/is_default won't affect the machine ABI:
-        'alias': None, # ignore field
-        'is_default': None,
-        'family': None,
-
-        # QOM stuff we can ignore:
-        'parent_class': None,
-        'next': None,
-    }
+def ensure_v2_ge(ctx, f, v1, v2):
+    """Ensure v2 is greater or equal to v1.  Useful when a property representes a limit, not a ABI-visible value"""
+    if v1 is UNKNOWN_VALUE:
+        ctx.report_result(WARN, "%s: I don't know how to deal with missing machine.%s field", ctx.binary1, f)
+        return
+    if v2 is UNKNOWN_VALUE:
+        ctx.report_result(WARN, "%s: I don't know how to deal with missing machine.%s field", ctx.binary2, f)
+        return
+    return v2 >= v1
+
+def ignore_unknown_value(ctx, f, v1, v2):
+    """Compare values, but don't print a warning if we don't know one of them"""
+    return (v1 is UNKNOWN_VALUE) or (v2 is UNKNOWN_VALUE) or (v1 == v2)
+
+def compare_func_name(ctx, f, v1, v2):
+    fname1 = v1 and FUNC_NAME_RE.search(v1).group(1)
+    fname2 = v2 and FUNC_NAME_RE.search(v2).group(1)
+    return fname1 == fname2
+
+def compare_nullness(ctx, f, v1, v2):
+    """Just check if both values are NULL or non-NULL"""
+    return (v1 is None) == (v2 is None)
+
+def compare_sysbus_list(ctx, f, v1, v2):
+    """The allowed sysbus list is allowed to grow, not shrink"""
+    #FIXME: gdb-extract-qemu-info.py doesn't translate strList, returns just {},
+    #       so all we can do is to check if the list didn't become empty
+    v1empty = v1 is None or v1 == []
+    v2empty = v2 is None or v2 == []
+    return v1empty or not v2empty
+
+KNOWN_MACHINE_FIELDS = {
+    # compat_props is checked separately by compare_machine_compat_props()
+    'compat_props': None,
+
+    # there's no easy way to support these fields on get_omitted_machine_field()
+    # because when the MachineClass fields were introduced
+    # (commit 71ae9e94d99240cd02926ad76fadb4963a873b09), some machine-types
+    # set them to true and others set them to false
+    'option_rom_has_mr': ignore_unknown_value,
+    'rom_file_has_mr': ignore_unknown_value,
+
+    # max_cpus doesn't need to match exactly: we just need it to be greater or equal
+    'max_cpus': ensure_v2_ge,
+    # has_dynamic_sybus can also change from 0 to 1, but not the other way around:
+    'has_dynamic_sysbus': ensure_v2_ge,
+    'allowed_dynamic_sysbus_devices': compare_sysbus_list,
+
+    # things we skip and won't try to validate:
+
+    #TODO: this script doesn't know yet how to compare hotpluggable-CPUs
+    # data between different QEMU versions
+    'query_hotpluggable_cpus': None,
+    'has_hotpluggable_cpus': None,
+    #TODO: script doesn't know what to do with 'reset' function pointer, either:
+    'reset': None,
+    #TODO: other functions we don't know how to compare:
+    'hot_add_cpu': None,
+    'init': None,
+    'get_hotplug_handler': None,
+    'possible_cpu_arch_ids': None,
+    'cpu_index_to_socket_id': None,
+    'cpu_index_to_instance_props': None,
+    'numa_auto_assign_ram': None,
+    'kvm_type': None,
+    'get_default_cpu_node_id': None,
+
+    # alias/is_default won't affect the machine ABI:
+    'alias': None, # ignore field
+    'is_default': None,
+    'family': None,
+
+    # QOM stuff we can ignore:
+    'parent_class': None,
+    'next': None,
+}
+
+# fields that compare_machine_simple_fields() won't look at:
+SKIPPED_MACHINE_FIELDS = frozenset(f for f, func in KNOWN_MACHINE_FIELDS.items() if func is None)
 
+def compare_machine_simple_fields(args, ctx, m1, m2):
+    fields = set(m1).union(m2)
+    fields.difference_update(SKIPPED_MACHINE_FIELDS)
+
+    b1_ctx = ctx.b1_ctx()
+    b2_ctx = ctx.b2_ctx()
     for f in fields:
-        compare_func = KNOWN_FIELDS.get(f, simple_compare)
-        if compare_func is None:
-            continue
+        compare_func = KNOWN_MACHINE_FIELDS.get(f, simple_compare)
 
-        if f in m1:
-            v1 = m1[f]
-        else:
+        v1 = m1.get(f, MISSING_FIELD)
+        if v1 is MISSING_FIELD:
             v1 = get_omitted_machine_field(m1, f)
 
-        if f in m2:
-            v2 = m2[f]
-        else:
+        v2 = m2.get(f, MISSING_FIELD)
+        if v2 is MISSING_FIELD:
             v2 = get_omitted_machine_field(m2, f)
 
-        v1 = fixup_machine_field(ctx.b1_ctx(), m1, f, v1)
-        v2 = fixup_machine_field(ctx.b2_ctx(), m2, f, v2)
+        v1 = fixup_machine_field(b1_ctx, m1, f, v1)
+        v2 = fixup_machine_field(b2_ctx, m2, f, v2)
 
         dbg("will compare machine.%s: %r vs %r", f, v1, v2)
-        r = compare_func(v1, v2)
+        r = compare_func(ctx, f, v1, v2)
         if r is None:
             continue
         elif r:
-            ctx.report_result(DEBUG, 'machine.%s is OK' % (f))
+            ctx.report_result(DEBUG, 'machine.%s is OK', f)
         else:
-            ctx.report_result(ERROR, "difference at machine.%s (%r != %r)" % (f, v1, v2))
+            ctx.report_result(ERROR, "difference at machine.%s (%r != %r)", f, v1, v2)
 
 def compare_machine(args, ctx):
     m1 = ctx.binary1.get_machine(ctx.machinename)
@@ -1064,14 +1451,93 @@ def machines_to_handle(args, ctx):
     if args.machines:
         return args.machines
     else:
-        machines = set(ctx.binary1.available_machines())
-        machines.intersection_update(ctx.binary2.available_machines())
-        return machines
+        return ctx.binary1.available_machines() & ctx.binary2.available_machines()
+
+class RecordingHandler(logging.Handler):
+    """Logging handler that just records (levelno, message) tuples"""
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append((record.levelno, record.getMessage()))
+
+# timeout for pool result calls, just to keep them interruptible
+POOL_GET_TIMEOUT = 365 * 24 * 60 * 60
+
+# (args, ctx) tuple inherited by worker processes from compare_machines_parallel()
+WORKER_STATE = None
+
+def compare_machine_worker(machinename):
+    """Compare a single machine-type inside a worker process
+
+    Returns the list of (levelno, message) tuples that were logged, so
+    the parent process can report them in order, and the (exception,
+    traceback) tuple for the exception raised by compare_machine(), if any.
+    """
+    args, ctx = WORKER_STATE
+    mctx = ctx.with_machine(machinename)
+    handler = RecordingHandler()
+    logger.addHandler(handler)
+    logger.propagate = False
+    error = None
+    try:
+        dbg("will compare machine: %s", mctx)
+        compare_machine(args, mctx)
+    except Exception as e:
+        # the messages logged before the exception still need to be
+        # reported by the parent process:
+        error = (e, traceback.format_exc())
+    finally:
+        logger.removeHandler(handler)
+        logger.propagate = True
+    return handler.messages, error
+
+def compare_machines_parallel(args, ctx, machines):
+    """Compare machine-types using args.jobs worker processes"""
+    # multiprocessing is only needed when --jobs is used
+    import multiprocessing
+
+    global WORKER_STATE
+    # build the lookup tables before forking, so workers don't redo it:
+    ctx.binary1.index_requests()
+    ctx.binary2.index_requests()
+    WORKER_STATE = (args, ctx)
+    pool = multiprocessing.Pool(args.jobs)
+    try:
+        results = pool.imap(compare_machine_worker, machines)
+        for _ in machines:
+            # a blocking next() without a timeout would keep
+            # KeyboardInterrupt from being delivered on Python 2:
+            messages, error = results.next(POOL_GET_TIMEOUT)
+            for levelno, msg in messages:
+                logger.log(levelno, '%s', msg)
+            if error is not None:
+                e, tb = error
+                logger.debug("Traceback from worker process:\n%s", tb)
+                raise e
+    except:
+        # stop at the first failure, like a sequential run:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+        WORKER_STATE = None
 
 def compare_binaries(args, ctx):
-    for m in machines_to_handle(args, ctx):
-        mctx = copy.copy(ctx)
-        mctx.machinename = m
+    machines = machines_to_handle(args, ctx)
+    # build the omitted property dictionaries up front, so -j workers
+    # don't build (and log) them again, and the debug messages are
+    # logged in the same order with and without -j:
+    ctx.binary1.omitted_props()
+    ctx.binary2.omitted_props()
+    if args.jobs > 1:
+        compare_machines_parallel(args, ctx, machines)
+        return
+    for m in machines:
+        mctx = ctx.with_machine(m)
         dbg("will compare machine: %s", mctx)
         compare_machine(args, mctx)
 
@@ -1086,10 +1552,40 @@ def print_machine(args, ctx):
 
 def print_binary(args, ctx):
     for m in machines_to_handle(args, ctx):
-        mctx = copy.copy(ctx)
-        mctx.machinename = m
+        mctx = ctx.with_machine(m)
         print_machine(args, mctx)
 
+def load_binary(args, b):
+    logger.info("Loading data from %s", b)
+    b.load_data(args)
+
+def load_binaries(args, binaries):
+    """Load data for all binaries, using up to args.jobs threads"""
+    if args.jobs <= 1 or len(binaries) <= 1:
+        for b in binaries:
+            load_binary(args, b)
+        return
+
+    # multiprocessing is only needed when --jobs is used.  Threads are
+    # enough here, as loading is mostly waiting for QEMU and gdb:
+    from multiprocessing.pool import ThreadPool
+
+    # log the messages up front, so their order doesn't depend on
+    # thread scheduling:
+    for b in binaries:
+        logger.info("Loading data from %s", b)
+    pool = ThreadPool(min(args.jobs, len(binaries)))
+    try:
+        # a blocking get() without a timeout would keep KeyboardInterrupt
+        # from being delivered on Python 2:
+        pool.map_async(lambda b: b.load_data(args), binaries).get(POOL_GET_TIMEOUT)
+    except:
+        # don't wait for the threads that are still loading data:
+        pool.terminate()
+        raise
+    pool.close()
+    pool.join()
+
 def main():
     parser = argparse.ArgumentParser(
         description='Compare machine-type compatibility info between multiple QEMU binaries')
@@ -1110,8 +1606,15 @@ def main():
     parser.add_argument('-q', '--quiet',
                         dest='loglevel', action='store_const', const=WARN,
                         help="Disable INFO messages")
+    parser.add_argument('-j', '--jobs', metavar='N', type=int, default=1,
+                        help="Load binaries and compare machine-types using N parallel jobs")
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false',
+                        help="Don't use or save cached gdb extractor results "
+                             "(needed after installing debuginfo for a binary)")
     parser.add_argument('-O', metavar='FILE', dest='dump_file',
                         help="Dump raw JSON data to FILE")
+    parser.add_argument('--pretty', action='store_true',
+                        help="Indent the JSON data written by -O")
 
     parser.add_argument('--qemu', '-Q', metavar='QEMU',
                         dest='files',
@@ -1128,6 +1631,11 @@ def main():
 
     logging.basicConfig(stream=sys.stdout, level=args.loglevel,
                         format='%(levelname)s: %(message)s')
+    if not logger.isEnabledFor(DEBUG):
+        # avoid the logging call overhead on hot paths:
+        global dbg
+        dbg = no_dbg
+
     binaries = []
     if args.files:
         binaries.extend([QEMUBinaryInfo(f, t) for f,t in args.files])
@@ -1142,14 +1650,17 @@ def main():
         parser.error("Dumping to a JSON file is supported only if a single QEMU binary is provided")
         return 1
 
-    for b in binaries:
-        logger.info("Loading data from %s", b)
-        b.load_data(args)
+    load_binaries(args, binaries)
 
     dbg("loaded data for all QEMU binaries")
 
     if args.dump_file:
-        json.dump(binaries[0].raw_data, open(args.dump_file, 'w'), indent=2)
+        if args.pretty:
+            dump_opts = dict(indent=2)
+        else:
+            dump_opts = dict(separators=(',', ':'))
+        with open(args.dump_file, 'w') as f:
+            json.dump(binaries[0].raw_data, f, **dump_opts)
 
     for i,b1 in enumerate(binaries):
         #print_binary(args, ValidationContext(binary1=b1))
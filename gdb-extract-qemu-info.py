@@ -38,6 +38,13 @@ import re
 logger = logging.getLogger('dump-machine-info')
 dbg = logger.debug
 
+try:
+    intern_str = sys.intern
+except AttributeError: # Python 2.7
+    # Value.string() returns unicode objects on Python 2.7, and they
+    # can't be interned:
+    intern_str = lambda s: s
+
 
 CATCH_EXCEPTIONS = False
 
@@ -73,6 +80,14 @@ def S(name):
     """
     return T('struct {}'.format(name))
 
+def TP(name):
+    """Shortcut to T(name).pointer()"""
+    return T(name).pointer()
+
+def SP(name):
+    """Shortcut to S(name).pointer()"""
+    return S(name).pointer()
+
 AUTO_GLOBALS = [
   'error_get_pretty',
   'find_machine',
@@ -132,6 +147,15 @@ AUTO_GLOBALS = [
   (S, 'QInt'),
   (S, 'QNum'),
   (S, 'QString'),
+
+  # pointer types used in loops, so we don't need to call
+  # Type.pointer() every time:
+  (TP, 'GArray_ptr', 'GArray'),
+  (SP, 'GlobalProperty_ptr', 'GlobalProperty'),
+  (SP, 'DeviceClass_ptr', 'DeviceClass'),
+  (SP, 'ObjectClass_ptr', 'ObjectClass'),
+  (SP, 'QObject_ptr', 'QObject'),
+  (SP, 'QObjectBase__ptr', 'QObjectBase_'),
 ]
 
 def register_auto_globals():
@@ -173,18 +197,21 @@ def command_loop():
                 pass
             prev = cmd
 
+# characters we don't know how to escape in gdb commands:
+GDB_INVALID_CHARS_RE = re.compile(r"""['"\\\s]""")
+# characters we don't know how to escape in C strings.  Be very
+# conservative, just in case:
+C_STRING_INVALID_CHARS_RE = re.compile(r'["\\\n]')
+
 def gdb_escape(s):
     """Escape string to use it on a gdb command"""
-    invalid_chars = re.compile(r"""['"\\\s]""")
-    if invalid_chars.search(s):
+    if GDB_INVALID_CHARS_RE.search(s):
         raise Exception("Sorry, I don't know how to escape %r in a gdb command" % (s))
     return s
 
 def c_string(s):
     """Return a C string literal sequence for a string"""
-    # be very conservative, just in case:
-    invalid_chars = re.compile(r'["\\\n]')
-    if invalid_chars.search(s):
+    if C_STRING_INVALID_CHARS_RE.search(s):
         raise Exception("Sorry, I don't know how to escape %r in a C string" % (s))
     return E('"%s"' % (s))
 
@@ -229,6 +256,9 @@ def enumerate_fields(t):
             for bitpos, name, sf in enumerate_fields(f.type.strip_typedefs()):
                 yield (f.bitpos + bitpos, '%s.%s' % (f.name, sf.name), sf)
 
+# (type name, field name) -> field, filled by find_field():
+FIELD_CACHE = {}
+
 def find_field(t, fieldname):
     """Find a field on a value or type"""
     dbg("find_field(%r, %r) called", t, fieldname)
@@ -236,10 +266,28 @@ def find_field(t, fieldname):
         t = t.type
     if t.code == gdb.TYPE_CODE_PTR:
         t = t.target()
+    # anonymous types ("struct {...}") can't be identified by name:
+    typename = str(t)
+    cacheable = '{' not in typename
+    key = (typename, fieldname)
+    if cacheable and key in FIELD_CACHE:
+        return FIELD_CACHE[key]
+    r = None
     for f in t.fields():
         if f.name == fieldname:
             dbg("find_field(%r, %r) -> %r", t, fieldname, f)
-            return f
+            r = f
+            break
+    if cacheable:
+        FIELD_CACHE[key] = r
+    return r
+
+# conversion functions for the simple cases handled by value_to_py():
+SIMPLE_VALUE_CONVERTERS = {
+    gdb.TYPE_CODE_INT: tolong,
+    gdb.TYPE_CODE_BOOL: bool,
+    gdb.TYPE_CODE_ENUM: str,
+}
 
 def value_to_py(v, follow_pointer=False):
     """Convert a single value to an equivalent Python value
@@ -253,10 +301,9 @@ def value_to_py(v, follow_pointer=False):
     #dbg("field %s, type: %s (code %s)", f.name, t, type_code_name(code))   w
     #if code == gdb.TYPE_CODE_PTR:
     #    dbg("target code: %s", type_code_name(t.target().code))
-    if code == gdb.TYPE_CODE_INT:
-        return tolong(v)
-    elif code == gdb.TYPE_CODE_BOOL:
-        return bool(v)
+    conv = SIMPLE_VALUE_CONVERTERS.get(code)
+    if conv is not None:
+        return conv(v)
     elif code == gdb.TYPE_CODE_PTR:
         target = t.target().strip_typedefs()
         if tolong(v) == 0: # NULL pointer
@@ -268,11 +315,11 @@ def value_to_py(v, follow_pointer=False):
         elif follow_pointer:
             return value_to_py(v.dereference(), follow_pointer)
         else:
-            dbg("not following pointer of target type: %s", type_code_name(target.code))
+            if logger.isEnabledFor(logging.DEBUG):
+                # type_code_name() is slow, call it only if debugging:
+                dbg("not following pointer of target type: %s", type_code_name(target.code))
             # empty dictionary just to indicate it's not a NULL pointer
             return dict()
-    elif code == gdb.TYPE_CODE_ENUM:
-        return str(v)
     elif code == gdb.TYPE_CODE_STRUCT or code == gdb.TYPE_CODE_UNION:
         return value_to_dict(v, follow_pointer if type(follow_pointer) == dict \
                                 else {})
@@ -293,10 +340,12 @@ def value_to_dict(v, follow_pointers={}):
 
     dbg("value_to_dict(%r)", v)
     dbg("type: %s", v.type)
-    v = v.cast(v.type.strip_typedefs())
-    dbg("new type: %s", v.type)
-    dbg("address of value: %x", tolong(v.address))
-    for f in v.type.fields():
+    t = v.type.strip_typedefs()
+    v = v.cast(t)
+    if logger.isEnabledFor(logging.DEBUG):
+        dbg("new type: %s", t)
+        dbg("address of value: %x", tolong(v.address))
+    for f in t.fields():
         fv = v[f.name]
         try:
             dbg("r[%r] = value_to_py(%r)", f.name, fv)
@@ -330,6 +379,10 @@ def global_prop_info(gp):
     r = value_to_dict(gp)
     if 'next' in r:
         del r['next'] # no need to return the linked-list field
+    # the same driver and property names appear on many machine-types:
+    for f in ('driver', 'property'):
+        if r.get(f) is not None:
+            r[f] = intern_str(r[f])
     return r
 
 
@@ -347,12 +400,13 @@ def compat_props_garray(v):
     #dbg("elem sz: %d", elem_sz)
     count = tolong(v['len'])
     #dbg("%d elements", count)
-    gptype = GlobalProperty.pointer()
+    # the array elements are GlobalProperty pointers:
+    gpptrtype = GlobalProperty_ptr.pointer()
     data = v['data']
     for i in range(count):
         addr = data + i*elem_sz
         #dbg("addr for elem %d: %x", i, tolong(addr))
-        gp = addr.cast(gptype.pointer()).dereference()
+        gp = addr.cast(gpptrtype).dereference()
         yield global_prop_info(gp)
 
 def compat_props_gp_array(cp):
@@ -372,9 +426,9 @@ def compat_props(mi):
 
     # currently we can only handle the GArray version of compat_props:
     #dbg("cp type: %s", cp.type)
-    if cp.type == GArray.pointer():
+    if cp.type == GArray_ptr:
         return list(compat_props_garray(cp))
-    elif cp.type == GlobalProperty.pointer():
+    elif cp.type == GlobalProperty_ptr:
         return list(compat_props_gp_array(cp))
     else:
         raise Exception("unsupported compat_props type: %s" % (cp.type))
@@ -446,11 +500,11 @@ def dev_class_props(dc):
         yield prop_info(prop)
         prop += 1
 
-    oc = dc.cast(ObjectClass.pointer())
+    oc = dc.cast(ObjectClass_ptr)
     parent = object_class_get_parent(oc)
     parent = object_class_dynamic_cast(parent, devstr)
     if tolong(parent) != 0:
-        parent_dc = parent.cast(DeviceClass.pointer())
+        parent_dc = parent.cast(DeviceClass_ptr)
         for p in dev_class_props(parent_dc):
             yield p
 
@@ -465,6 +519,23 @@ def qnum_value(qn):
     else:
         raise Exception("Unexpected qnum kind: %d", kind)
 
+# QType enum values we look for in qobject_value():
+QTYPE_NAMES = ['QTYPE_NONE', 'QTYPE_QNUM', 'QTYPE_QBOOL', 'QTYPE_QDICT',
+               'QTYPE_QFLOAT', 'QTYPE_QINT', 'QTYPE_QSTRING']
+QTYPE_VALUES = None
+
+def qtype_values():
+    """Return dictionary with QTYPE_* values converted to Python ints
+
+    Enum values that don't exist on this QEMU version are not included.
+    The dictionary is built only once.
+    """
+    global QTYPE_VALUES
+    if QTYPE_VALUES is None:
+        QTYPE_VALUES = dict((name, tolong(globals()[name])) for name in QTYPE_NAMES
+                            if globals()[name] is not None)
+    return QTYPE_VALUES
+
 def qobject_value(qobj):
     """Convert QObject value to a Python value"""
     dbg("qobject_value(%r) called", qobj)
@@ -472,33 +543,36 @@ def qobject_value(qobj):
     #dbg("qobj type: %s (size: %d)" % (qobj.type, qobj.type.sizeof))
     #execute("x /%dxb 0x%x" % (qobj.type.sizeof, tolong(qobj)))
     #execute("p qstring_get_str(0x%x)" % (tolong(qobj)))
-    qobj = qobj.cast(QObject.pointer())
+    qobj = qobj.cast(QObject_ptr)
     if QObjectBase_ is not None:
         # handle API change introduced by 3d3eacaeccaab718ea0e2ddaa578bfae9e311c59:
         # Now QObject base fields are inside `struct QObjectBase_ base` inside struct QObject
-        qobj = qobj.cast(QObjectBase_.pointer())
+        qobj = qobj.cast(QObjectBase__ptr)
     dbg("after cast: %r", qobj)
     qtype = qobj['type']
     dbg("qtype(1): %r", qtype)
     if find_field(qtype, 'code'):
         qtype = qtype['code']
     dbg("qtype(2): %r", qtype)
-    if qtype == QTYPE_NONE:
+    # compare Python ints instead of gdb.Value objects:
+    qtype = tolong(qtype)
+    qtypes = qtype_values()
+    if qtype == qtypes.get('QTYPE_NONE'):
         return None
-    elif QTYPE_QINT is not None and qtype == QTYPE_QINT:
+    elif qtype == qtypes.get('QTYPE_QINT'):
         return tolong(qint_get_int(qobj.cast(QInt.pointer())))
-    elif QTYPE_QNUM is not None and qtype == QTYPE_QNUM:
+    elif qtype == qtypes.get('QTYPE_QNUM'):
         return qnum_value(qobj.cast(QNum.pointer()))
-    elif qtype == QTYPE_QSTRING:
+    elif qtype == qtypes.get('QTYPE_QSTRING'):
         return qstring_get_str(qobj.cast(QString.pointer())).string()
-    elif qtype == QTYPE_QFLOAT:
+    elif qtype == qtypes.get('QTYPE_QFLOAT'):
         return float('qfloat_get_float')(qobj.cast(QFloat.pointer()))
-    elif qtype == QTYPE_QBOOL:
+    elif qtype == qtypes.get('QTYPE_QBOOL'):
         if qbool_get_bool:
             return bool(qbool_get_bool(qobj.cast(QBool.pointer())))
         else:
             return bool(qbool_get_int(qobj.cast(QBool.pointer())))
-    elif qtype == QTYPE_QDICT:
+    elif qtype == qtypes.get('QTYPE_QDICT'):
         raise Exception("I don't know how to handle %s qobject type" % (qtype))
 
 def object_iter_props(obj):
@@ -543,12 +617,16 @@ def object_iter_props(obj):
         for p in qtailq_foreach(obj['properties'], 'node'):
             yield p
 
-def object_prop_get_value(devtype, obj, prop, p):
+def object_prop_get_value(devtype, obj, prop, p, errp):
     """Get property value from object, and set 'value' dictionary field
 
     If an exception or error occurrs, the 'value-exception' or 'value-error'
     fields will be set, instead.
 
+    errp must point to a NULL Error* variable.  Returns True if *errp is
+    still NULL, so errp can be reused for the next property.  Otherwise,
+    errp is freed or left alone, and must not be used again.
+
     This operation is very risky: there are some devices that
     don't expect have their properties queried without being
     realized first. Some examples:
@@ -557,7 +635,6 @@ def object_prop_get_value(devtype, obj, prop, p):
     * pc-dimm "size" property will crash if dimm->hostmem is not set
     """
     dbg("object_prop_get_value(%r, %r, %r, %r) called", devtype, obj, prop, p)
-    errp = g_new0(Error.pointer())
     try:
         dbg("will call get_qobject:")
         val = object_property_get_qobject(obj, prop['name'], errp)
@@ -566,11 +643,13 @@ def object_prop_get_value(devtype, obj, prop, p):
             dbg("will call qobject_value:")
             p['value'] = qobject_value(val)
             dbg("p['value'] = %r", p['value'])
+            return True
         else:
             msg = error_get_pretty(errp.dereference()).string()
             logger.info("Error trying to get property %r from devtype %r: %s" % (p['name'], devtype, msg))
             p['value-error'] = msg
-        g_free(errp)
+            g_free(errp)
+            return False
     except KeyboardInterrupt:
         raise
     except:
@@ -579,6 +658,7 @@ def object_prop_get_value(devtype, obj, prop, p):
         p['value-exception'] = dict(traceback=traceback.format_exc())
         if CATCH_EXCEPTIONS:
             raise
+        return False
 
 def object_class_instance_props(devtype, oc):
     """Try to query QOM properties available when actual instantiating an object"""
@@ -590,6 +670,10 @@ def object_class_instance_props(devtype, oc):
 
     obj = object_new(c_string(devtype))
     #dbg("obj: 0x%x: %s", tolong(obj), obj.dereference())
+    # the same Error* variable is reused for all properties, unless
+    # an error is returned.  This saves two inferior function calls
+    # (g_malloc0() and g_free()) for each property:
+    errp = None
     for prop in object_iter_props(obj):
         dbg("converting instance prop %r", prop)
         p = value_to_dict(prop)
@@ -604,9 +688,14 @@ def object_class_instance_props(devtype, oc):
         if propkey in UNSAFE_PROPS:
             dbg("skipping unsafe property: %s", propkey)
         else:
-            object_prop_get_value(devtype, obj, prop, p)
+            if errp is None:
+                errp = g_new0(Error.pointer())
+            if not object_prop_get_value(devtype, obj, prop, p, errp):
+                errp = None
 
         yield p
+    if errp is not None:
+        g_free(errp)
     object_unref(obj)
 
 def unwrap_machine(mc):
@@ -678,7 +767,7 @@ def query_device_type(args, devtype):
     if tolong(oc) == 0:
         raise Exception("Can't find type %s" % (devtype))
 
-    dc = oc.cast(DeviceClass.pointer())
+    dc = oc.cast(DeviceClass_ptr)
     #dbg("oc: 0x%x, dc: 0x%x", tolong(oc), tolong(dc))
     result = {}
     result.update(value_to_dict(dc, follow_pointers={'vmsd':True}))
@@ -822,7 +911,8 @@ for r in handle_requests(args):
     if not first:
         out.write(",")
     out.write("\n  ")
-    json.dump(r, out)
+    # json.dumps() uses the C encoder, json.dump() doesn't:
+    out.write(json.dumps(r, separators=(',', ':')))
     if r.get('traceback'):
         tracebacks.append(r)
     first = False
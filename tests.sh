@@ -306,6 +306,48 @@ check_expected max_cpus_zero_one -q F1 F2
 
 
 
+# -j should report the same results as a sequential run, in the same order:
+
+cat > F1 <<EOF
+[{"request":["machine", "M1"],
+  "result":{"max_cpus":100,
+            "compat_props":[{"driver":"mydev",
+                             "property":"myprop",
+                             "value":"X"}]}},
+ {"request":["machine", "M2"],
+  "result":{"compat_props":[{"driver":"mydev",
+                             "property":"myprop",
+                             "value":"X"},
+                            {"driver":"mydev",
+                             "property":"myprop",
+                             "value":"X"}]}},
+ {"request":["machine", "M3"],
+  "result":{"max_cpus":0}}]
+EOF
+cat > F2 <<EOF
+[{"request":["machine", "M1"],
+  "result":{"max_cpus":99,
+            "compat_props":[{"driver":"mydev",
+                             "property":"myprop",
+                             "value":"Y"}]}},
+ {"request":["machine", "M2"],
+  "result":{"compat_props":[{"driver":"mydev",
+                             "property":"myprop",
+                             "value":"X"}]}},
+ {"request":["machine", "M3"],
+  "result":{"max_cpus":1}}]
+EOF
+"${MYDIR}/compat_checker.py" -q -M M1 -M M2 -M M3 F1 F2 > EXPECTED
+
+check_expected parallel_jobs -q -j 2 -M M1 -M M2 -M M3 F1 F2
+
+# including the INFO messages logged while loading the files:
+"${MYDIR}/compat_checker.py" -M M1 -M M2 -M M3 F1 F2 > EXPECTED
+
+check_expected parallel_loading -j 2 -M M1 -M M2 -M M3 F1 F2
+
+
+
 #PLANNED:
 # warning when a device type vanishes and is not supported anymore:
 #